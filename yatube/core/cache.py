@@ -0,0 +1,521 @@
+"""Кэш в файле SQLite, общий для всех процессов одного хоста.
+
+LocMemCache у каждого процесса свой: прогрев, счётчики и поколения
+лент в одном воркере не видны другим. Этот бэкенд хранит записи
+в одном файле SQLite в режиме WAL — читатели не ждут писателя,
+а add и incr выполняются одним атомарным запросом.
+
+Записи вытесняются по TTL и, когда их больше MAX_ENTRIES, по давности
+последнего чтения (LRU). Время чтения обновляется не чаще раза
+в ACCESS_RESOLUTION секунд, чтобы чтения не превращались в записи.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': '/tmp/yatube_cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 10000, 'CULL_FREQUENCY': 3},
+        }
+    }
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+
+# Запись жива, если у неё нет срока или он ещё не наступил.
+ALIVE = '(expires IS NULL OR expires > ?)'
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._access_resolution = options.get('ACCESS_RESOLUTION', 10)
+        # Заполненность проверяется не на каждой записи: COUNT(*)
+        # в SQLite проходит всю таблицу.
+        self._cull_check_every = options.get('CULL_CHECK_EVERY', 100)
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        # Соединение своё у каждого потока и процесса: после fork
+        # унаследованное соединение использовать нельзя.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    @staticmethod
+    def _dump(value):
+        # Целые храним как есть, чтобы incr шёл одним UPDATE.
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _touch_rows(self, keys, now):
+        self._db.executemany(
+            'UPDATE cache SET accessed = ? WHERE key = ?',
+            [(now, key) for key in keys],
+        )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        row = self._db.execute(
+            f'SELECT value, accessed FROM cache WHERE key = ? AND {ALIVE}',
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return default
+        value, accessed = row
+        if now - accessed > self._access_resolution:
+            self._touch_rows([key], now)
+        return self._load(value)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        now = time.time()
+        rows = self._db.execute(
+            f'SELECT key, value, accessed FROM cache '
+            f'WHERE key IN ({", ".join("?" * len(keys))}) AND {ALIVE}',
+            (*keys, now),
+        ).fetchall()
+        self._touch_rows(
+            [key for key, _, accessed in rows
+             if now - accessed > self._access_resolution],
+            now,
+        )
+        return {keys[key]: self._load(value) for key, value, _ in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        self._db.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)',
+            (key, self._dump(value), self.get_backend_timeout(timeout),
+             time.time()),
+        )
+        self._maybe_cull()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        self._db.executemany(
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)',
+            [
+                (self._key(key, version), self._dump(value), expires, now)
+                for key, value in data.items()
+            ],
+        )
+        self._maybe_cull()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        # Одна вставка: занять ключ можно, только если записи нет
+        # или она истекла, поэтому add годится для блокировок.
+        cursor = self._db.execute(
+            'INSERT INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires, accessed = excluded.accessed '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (key, self._dump(value), self.get_backend_timeout(timeout),
+             now, now),
+        )
+        if cursor.rowcount:
+            self._maybe_cull()
+        return bool(cursor.rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        row = self._db.execute(
+            f'UPDATE cache SET value = value + ? WHERE key = ? AND {ALIVE} '
+            f"AND typeof(value) = 'integer' RETURNING value",
+            (delta, key, time.time()),
+        ).fetchone()
+        if row is None:
+            raise ValueError("Key '%s' not found" % key)
+        return row[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._db.execute(
+            f'UPDATE cache SET expires = ?, accessed = ? '
+            f'WHERE key = ? AND {ALIVE}',
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return bool(cursor.rowcount)
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._db.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {ALIVE}',
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self._db.execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),)
+        )
+
+    def delete_many(self, keys, version=None):
+        self._db.executemany(
+            'DELETE FROM cache WHERE key = ?',
+            [(self._key(key, version),) for key in keys],
+        )
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _maybe_cull(self):
+        if random.randrange(self._cull_check_every) == 0:
+            self.cull()
+
+    def cull(self):
+        """Удаляет истёкшие записи, а при переполнении — долго не читанные.
+
+        Как и у встроенных бэкендов, удаляется 1/CULL_FREQUENCY записей;
+        при CULL_FREQUENCY = 0 кэш очищается целиком.
+        """
+        db = self._db
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            self.clear()
+            return
+        db.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM cache ORDER BY accessed LIMIT ?'
+            ')',
+            (count // self._cull_frequency,),
+        )
+
+    def close(self, **kwargs):
+        # Соединения потоков держим открытыми между запросами:
+        # открывать файл на каждый запрос дороже самих операций.
+        pass
+
+
+_MISSING = object()
+
+
+def _immutable(value):
+    if isinstance(value, tuple):
+        return all(_immutable(item) for item in value)
+    # Подклассы строк (SafeText фрагментов) тоже неизменяемы.
+    return value is None or isinstance(value, (str, bytes, int, float))
+
+
+class TieredCache(BaseCache):
+    """Маленький LRU-кэш процесса (L1) перед общим кэшем (L2).
+
+    LOCATION — имя кэша L2 в CACHES, MAX_ENTRIES — размер L1.
+
+    Чтения самых частых ключей — фрагментов лент, поколений, миниатюр —
+    не ходят в L2 и не распаковывают значение. Запись идёт в L2 и
+    публикуется в журнал инвалидаций в L2: номер последнего события
+    (штамп) и ключ каждого события. Раз в BROADCAST_INTERVAL секунд
+    процесс сверяет свой штамп со штампом L2 и выбрасывает из L1
+    изменённые другими ключи; если события уже вытеснены, L1
+    очищается целиком. Записи L1 живут не дольше L1_TIMEOUT.
+
+    Счётчики попаданий и промахов по уровням раз в STATS_INTERVAL
+    секунд сбрасываются в L2 и суммируются по всем процессам
+    (см. команду cache_stats).
+    """
+    SEQ_KEY = 'tiered:seq'
+    STATS = ('l1_hits', 'l1_misses', 'l2_hits', 'l2_misses')
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = location
+        self._l1_timeout = options.get('L1_TIMEOUT', 5)
+        self._interval = options.get('BROADCAST_INTERVAL', 0.2)
+        self._log_timeout = options.get('LOG_TIMEOUT', 60)
+        self._stats_interval = options.get('STATS_INTERVAL', 10)
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        self._seen = None
+        self._published = set()
+        self._synced = 0
+        self._stats_flushed = 0
+        self._stats = dict.fromkeys(self.STATS, 0)
+
+    @property
+    def _l2(self):
+        return caches[self._l2_alias]
+
+    def event_key(self, seq):
+        return f'tiered:event:{seq}'
+
+    # L1
+
+    def _remember(self, key, value, timeout=DEFAULT_TIMEOUT, seen=_MISSING):
+        """Кладёт значение в L1.
+
+        seen — штамп журнала до чтения value из L2. Если с тех пор
+        другой поток выбросил изменённые ключи, value мог устареть,
+        и в L1 он не кладётся, чтобы не отменить инвалидацию.
+        """
+        expires = time.time() + self._l1_timeout
+        backend_timeout = self.get_backend_timeout(timeout)
+        if backend_timeout is not None:
+            expires = min(expires, backend_timeout)
+        # Изменяемые значения храним упакованными: иначе вызывающие
+        # делили бы один объект и правили бы его друг у друга.
+        if not _immutable(value):
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            packed = True
+        else:
+            packed = False
+        with self._lock:
+            if seen is not _MISSING and seen != self._seen:
+                return
+            self._l1[key] = (value, packed, expires)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self._max_entries:
+                self._l1.popitem(last=False)
+
+    def _recall(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return _MISSING
+            value, packed, expires = entry
+            if expires <= time.time():
+                del self._l1[key]
+                return _MISSING
+            self._l1.move_to_end(key)
+        return pickle.loads(value) if packed else value
+
+    def _forget(self, keys):
+        with self._lock:
+            for key in keys:
+                self._l1.pop(key, None)
+
+    def _count(self, stat, amount=1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    # Журнал инвалидаций
+
+    def _publish(self, keys):
+        l2 = self._l2
+        for key in keys:
+            try:
+                seq = l2.incr(self.SEQ_KEY)
+            except ValueError:
+                l2.add(self.SEQ_KEY, 0, None)
+                seq = l2.incr(self.SEQ_KEY)
+            l2.set(self.event_key(seq), key, self._log_timeout)
+            with self._lock:
+                self._published.add(seq)
+
+    def sync(self, force=False):
+        """Сверяет L1 с журналом инвалидаций и сбрасывает статистику."""
+        now = time.monotonic()
+        if not force and now - self._synced < self._interval:
+            return
+        self._synced = now
+        l2 = self._l2
+        seq = l2.get(self.SEQ_KEY, 0)
+        seen, self._seen = self._seen, seq
+        if seen is None or seq < seen:
+            self._clear_l1()
+        elif seq > seen:
+            # Свои события L1 уже учёл при записи.
+            with self._lock:
+                own = self._published
+                self._published = {n for n in own if n > seq}
+            expected = [
+                self.event_key(n) for n in range(seen + 1, seq + 1)
+                if n not in own
+            ]
+            events = l2.get_many(expected)
+            if len(events) < len(expected) or '*' in events.values():
+                self._clear_l1()
+            else:
+                self._forget(events.values())
+        if force or now - self._stats_flushed >= self._stats_interval:
+            self._stats_flushed = now
+            self._flush_stats()
+
+    def _clear_l1(self):
+        with self._lock:
+            self._l1.clear()
+
+    def _flush_stats(self):
+        with self._lock:
+            stats = {name: count for name, count in self._stats.items()
+                     if count}
+            self._stats = dict.fromkeys(self.STATS, 0)
+        l2 = self._l2
+        for name, count in stats.items():
+            key = f'tiered:stats:{name}'
+            try:
+                l2.incr(key, count)
+            except ValueError:
+                if not l2.add(key, count, None):
+                    l2.incr(key, count)
+
+    def stats(self):
+        """Попадания и промахи по уровням по всем процессам."""
+        self.sync(force=True)
+        l2 = self._l2
+        values = l2.get_many([f'tiered:stats:{name}' for name in self.STATS])
+        return {
+            name: values.get(f'tiered:stats:{name}', 0)
+            for name in self.STATS
+        }
+
+    def reset_stats(self):
+        self.sync(force=True)
+        self._l2.delete_many([f'tiered:stats:{name}' for name in self.STATS])
+
+    # Интерфейс кэша
+
+    def get(self, key, default=None, version=None):
+        self.sync()
+        made = self.make_key(key, version)
+        value = self._recall(made)
+        if value is not _MISSING:
+            self._count('l1_hits')
+            return value
+        self._count('l1_misses')
+        seen = self._seen
+        value = self._l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count('l2_misses')
+            return default
+        self._count('l2_hits')
+        self._remember(made, value, seen=seen)
+        return value
+
+    def get_many(self, keys, version=None):
+        self.sync()
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._recall(self.make_key(key, version))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        self._count('l1_hits', len(found))
+        self._count('l1_misses', len(missing))
+        if missing:
+            seen = self._seen
+            values = self._l2.get_many(missing, version=version)
+            self._count('l2_hits', len(values))
+            self._count('l2_misses', len(missing) - len(values))
+            for key, value in values.items():
+                self._remember(self.make_key(key, version), value, seen=seen)
+            found.update(values)
+        return found
+
+    def _changed(self, keys, version):
+        self.sync()
+        made = [self.make_key(key, version) for key in keys]
+        self._forget(made)
+        self._publish(made)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l2.set(key, value, timeout, version=version)
+        self._changed([key], version)
+        self._remember(self.make_key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._l2.set_many(data, timeout, version=version)
+        self._changed(data, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._l2.add(key, value, timeout, version=version)
+        if added:
+            self._changed([key], version)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        value = self._l2.incr(key, delta, version=version)
+        self._changed([key], version)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        touched = self._l2.touch(key, timeout, version=version)
+        self._changed([key], version)
+        return touched
+
+    def has_key(self, key, version=None):
+        self.sync()
+        if self._recall(self.make_key(key, version)) is not _MISSING:
+            return True
+        return self._l2.has_key(key, version=version)
+
+    def delete(self, key, version=None):
+        self._l2.delete(key, version=version)
+        self._changed([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self._l2.delete_many(keys, version=version)
+        self._changed(keys, version)
+
+    def clear(self):
+        l2 = self._l2
+        # Штамп переживает очистку, иначе процессы со штампом не меньше
+        # нового не заметили бы её.
+        seq = l2.get(self.SEQ_KEY, 0)
+        l2.clear()
+        l2.add(self.SEQ_KEY, seq, None)
+        self._clear_l1()
+        self._publish(['*'])
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+def isolated_caches():
+    """Настройки кэшей для тестов: общий L2 в памяти процесса.
+
+    Тесты очищают кэш, а файл SQLite из CACHES общий с запущенными
+    рядом сервером и воркерами, поэтому тесты его не трогают.
+    """
+    return override_settings(CACHES={
+        **settings.CACHES,
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'yatube-tests',
+            'OPTIONS': settings.CACHES['shared'].get('OPTIONS', {}),
+        },
+    })
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._caches = isolated_caches()
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,120 @@
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+
+from .models import Group, Post
+from .paginators import CursorPaginator
+from .thumbnails import lookup_thumbnails
+from .timelines import follow_feed
+from .views import NUM
+
+
+User = get_user_model()
+
+# Поля поста в ответе API и колонки, из которых они читаются.
+FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'thumbnail': 'image',
+    'comment_count': 'comment_count',
+}
+# Поля, которые у таблиц ссылок на посты (ленты подписок)
+# есть свои, без JOIN с постом.
+LINKED_COLUMNS = {
+    'id': 'post_id',
+    'pub_date': 'pub_date',
+}
+
+
+def error(message, status=400):
+    return JsonResponse(
+        {'detail': message},
+        status=status,
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+def requested_fields(request):
+    fields = request.GET.get('fields')
+    if not fields:
+        return list(FIELDS)
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = sorted(set(fields) - FIELDS.keys())
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(unknown)}.')
+    return fields
+
+
+def column(queryset, field):
+    if queryset.model is Post:
+        return FIELDS[field]
+    return LINKED_COLUMNS.get(field, f'post__{FIELDS[field]}')
+
+
+def feed_response(request, queryset):
+    """Страница ленты в JSON: посты как словари из values().
+
+    Страницы листаются курсорами next/previous (?after=, ?before=),
+    fields= выбирает поля, миниатюры всей страницы находятся
+    одним запросом к хранилищу.
+    """
+    try:
+        fields = requested_fields(request)
+    except ValueError as exc:
+        return error(str(exc))
+    ordering = queryset.query.order_by or CursorPaginator.ordering
+    keys = {field.lstrip('-') for field in ordering}
+    columns = {field: column(queryset, field) for field in fields}
+    paginator = CursorPaginator(
+        queryset.order_by(*ordering).values(*set(columns.values()) | keys),
+        NUM,
+    )
+    page = paginator.cursor_page(
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
+    thumbnails = {}
+    if 'thumbnail' in fields:
+        thumbnails = lookup_thumbnails(
+            [row[columns['thumbnail']] for row in page], 'card'
+        )
+    results = []
+    for row in page:
+        post = {field: row[columns[field]] for field in fields}
+        if 'image' in post:
+            post['image'] = (
+                default_storage.url(post['image']) if post['image'] else None
+            )
+        if 'thumbnail' in post:
+            thumbnail = thumbnails.get(post['thumbnail'])
+            post['thumbnail'] = thumbnail.url if thumbnail else None
+        results.append(post)
+    return JsonResponse({
+        'results': results,
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+def index(request):
+    return feed_response(request, Post.objects.for_feed())
+
+
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(request, Post.objects.for_feed().filter(group=group))
+
+
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return feed_response(request, author.posts.for_feed())
+
+
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return error('Нужна авторизация.', status=401)
+    return feed_response(request, follow_feed(request.user))
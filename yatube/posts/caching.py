@@ -0,0 +1,162 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def index_scope():
+    return 'index'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def tag_scope(tag_id):
+    return f'tag:{tag_id}'
+
+
+def profile_scope(user_id):
+    return f'profile:{user_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def comments_scope(post_id):
+    return f'comments:{post_id}'
+
+
+def feed_count_key(scope):
+    return f'posts:feed_count:{scope}'
+
+
+def get_feed_count(scope, count_func):
+    """Возвращает количество постов ленты из кэша.
+
+    При промахе один раз считает его через count_func и кладёт в кэш.
+    """
+    key = feed_count_key(scope)
+    count = cache.get(key)
+    if count is None:
+        count = count_func()
+        cache.set(key, count, settings.FEED_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def change_feed_counts(scopes, delta):
+    """Сдвигает сохранённые счётчики лент на delta без пересчёта.
+
+    Если счётчика в кэше нет, его посчитают при следующем чтении.
+    """
+    for scope in scopes:
+        try:
+            cache.incr(feed_count_key(scope), delta)
+        except ValueError:
+            pass
+
+
+def drop_feed_counts(scopes):
+    cache.delete_many([feed_count_key(scope) for scope in scopes])
+
+
+def feed_version_key(scope):
+    return f'posts:feed_version:{scope}'
+
+
+def get_feed_version(scope):
+    """Текущее поколение ленты, часть ключей её кэша.
+
+    Начальное значение берётся от текущего времени, чтобы после
+    вытеснения счётчика из кэша не вернуться к старым ключам.
+    """
+    key = feed_version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_feed_version(scope):
+    """Делает устаревшими все закэшированные фрагменты ленты."""
+    try:
+        cache.incr(feed_version_key(scope))
+    except ValueError:
+        get_feed_version(scope)
+
+
+def bump_feed_versions(scopes):
+    for scope in scopes:
+        bump_feed_version(scope)
+
+
+def feed_cache_key(scope, request):
+    """Ключ фрагмента ленты: лента, её поколение и страница или курсор."""
+    page = ':'.join(
+        request.GET.get(param, '')
+        for param in ('page', 'after', 'before', 'last')
+    )
+    return f'{scope}:{get_feed_version(scope)}:{page}'
+
+
+def get_feed_versions(scopes):
+    """Поколения нескольких лент одним обращением к кэшу."""
+    keys = [feed_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    return [
+        versions[key] if key in versions else get_feed_version(scope)
+        for key, scope in zip(keys, scopes)
+    ]
+
+
+def comments_cache_key(post_id, request):
+    """Ключ страницы комментариев: поколение комментариев поста
+    и параметры запроса. Служит и ETag этой страницы.
+    """
+    scope = comments_scope(post_id)
+    params = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    return f'{scope}:{get_feed_version(scope)}:{params}'
+
+
+def follow_feed_scope(user_id, author_ids):
+    """Лента подписок пользователя на авторов author_ids.
+
+    Посты не сдвигают поколения лент подписчиков по одной, поэтому
+    в имя ленты входят поколения лент всех авторов, на которых
+    подписан пользователь: новый пост любого из них даёт ленте новое
+    имя, а с ним новые ключи фрагментов и счётчика.
+    """
+    scope = follow_scope(user_id)
+    if not author_ids:
+        return scope
+    versions = get_feed_versions(
+        [scope] + [author_scope(author_id) for author_id in
+                   sorted(author_ids)]
+    )
+    digest = hashlib.md5(repr(versions).encode()).hexdigest()[:16]
+    return f'{scope}:{digest}'
+
+
+def page_etag(request, scopes):
+    """ETag страницы из поколений её лент, пользователя и параметров.
+
+    Считается без запросов к лентам, поэтому на совпавший
+    If-None-Match можно ответить 304 до них. Пользователь и его
+    CSRF-токен входят в ETag: шапка, кнопки и формы зависят от них.
+    """
+    parts = get_feed_versions(scopes)
+    parts.append(request.user.pk if request.user.is_authenticated else 0)
+    parts.append(request.META.get('CSRF_COOKIE', ''))
+    parts.append(request.GET.urlencode())
+    return hashlib.md5(repr(parts).encode()).hexdigest()
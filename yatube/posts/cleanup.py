@@ -0,0 +1,193 @@
+import os
+import shutil
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from sorl.thumbnail import default as thumbnail_default
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from .images import EXTENSIONS, variant_path
+from .models import Post
+from .tasks import run_in_background
+
+
+def upload_dir():
+    return Post._meta.get_field('image').upload_to.strip('/')
+
+
+def thumbnails_dir():
+    return thumbnail_settings.THUMBNAIL_PREFIX.strip('/')
+
+
+def is_derived(parts):
+    """Файл — миниатюра или вариант, который можно создать заново."""
+    return parts[0] in (settings.POST_IMAGE_VARIANTS_DIR, thumbnails_dir())
+
+
+def is_referenced(name):
+    return Post.objects.filter(image=name).exists()
+
+
+def delete_variants(name):
+    for alias, (_, widths) in settings.POST_IMAGE_VARIANTS.items():
+        for width in widths:
+            for image_format in EXTENSIONS:
+                try:
+                    os.remove(variant_path(name, alias, width, image_format))
+                except FileNotFoundError:
+                    pass
+
+
+def delete_derived_files(name):
+    """Удаляет миниатюры sorl и варианты картинки, оригинал не трогает."""
+    delete_thumbnails(name, delete_file=False)
+    delete_variants(name)
+
+
+def delete_image_files(name):
+    """Удаляет картинку со всеми производными файлами.
+
+    Ничего не делает, если на картинку всё ещё ссылается какой-то пост.
+    """
+    if is_referenced(name):
+        return
+    delete_derived_files(name)
+    default_storage.delete(name)
+
+
+def schedule_image_cleanup(name):
+    """Удаляет файлы картинки в фоне после коммита транзакции."""
+    run_in_background(delete_image_files, name)
+
+
+def walk_media(after=()):
+    """Файлы картинок постов, их миниатюр и вариантов в порядке путей.
+
+    Отдаёт пары (части пути относительно MEDIA_ROOT, DirEntry).
+    Порядок обхода совпадает с порядком кортежей частей пути, поэтому
+    обход можно продолжить после частей after, не читая каталоги,
+    которые целиком лежат до них.
+    """
+    def walk(path, parts):
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            entry_parts = parts + (entry.name,)
+            if entry.is_dir(follow_symlinks=False):
+                if entry_parts >= after[:len(entry_parts)]:
+                    yield from walk(entry.path, entry_parts)
+            elif entry.is_file(follow_symlinks=False) and entry_parts > after:
+                yield entry_parts, entry
+
+    tops = (upload_dir(), settings.POST_IMAGE_VARIANTS_DIR, thumbnails_dir())
+    for top in sorted(tops):
+        if (top,) >= after[:1]:
+            yield from walk(os.path.join(settings.MEDIA_ROOT, top), (top,))
+
+
+def source_name(parts):
+    """Имя картинки поста, к которой относится файл."""
+    if parts[0] == settings.POST_IMAGE_VARIANTS_DIR:
+        # variants/<вариант>/<ширина>/<имя картинки>.<формат>
+        return os.path.splitext('/'.join(parts[3:]))[0]
+    return '/'.join(parts)
+
+
+def thumbnail_key(parts):
+    """Ключ записи миниатюры в kvstore sorl."""
+    return add_prefix(
+        ImageFile('/'.join(parts), thumbnail_default.storage).key
+    )
+
+
+def find_orphans(files, min_age):
+    """Файлы пачки, на картинки которых не ссылается ни один пост.
+
+    Миниатюра осиротела, если о ней нет записи в kvstore sorl: тогда
+    её не найдёт и не удалит ни sorl, ни delete_derived_files.
+    Для пачки делается не больше двух запросов; свежие файлы
+    пропускаются, так как пост с только что загруженной картинкой
+    может быть ещё не сохранён.
+    """
+    deadline = time.time() - min_age
+    old = [
+        (parts, entry) for parts, entry in files
+        if entry.stat(follow_symlinks=False).st_mtime < deadline
+    ]
+    thumbnails = {
+        parts: thumbnail_key(parts) for parts, _ in old
+        if parts[0] == thumbnails_dir()
+    }
+    names = {
+        parts: source_name(parts) for parts, _ in old
+        if parts not in thumbnails
+    }
+    known = set(
+        KVStore.objects.filter(
+            key__in=set(thumbnails.values())
+        ).values_list('key', flat=True)
+    )
+    referenced = set(
+        Post.objects.filter(
+            image__in=set(names.values())
+        ).values_list('image', flat=True)
+    )
+    return [
+        (parts, entry) for parts, entry in old
+        if (thumbnails[parts] not in known if parts in thumbnails
+            else names[parts] not in referenced)
+    ]
+
+
+def orphaned_thumbnail_sources(chunk_size):
+    """Картинки без постов, от которых в kvstore sorl остались миниатюры.
+
+    Так бывает, если оригинал удалили в обход delete_image_files.
+    Файлы таких миниатюр по-прежнему значатся в kvstore, поэтому
+    find_orphans их не трогает; удалять их нужно через sorl.
+    """
+    thumbnails_prefix = add_prefix('', 'thumbnails')
+    keys = KVStore.objects.filter(
+        key__startswith=thumbnails_prefix
+    ).values_list('key', flat=True).iterator()
+    chunk = list(islice(keys, chunk_size))
+    while chunk:
+        sources = KVStore.objects.filter(key__in=[
+            add_prefix(key[len(thumbnails_prefix):]) for key in chunk
+        ]).values_list('value', flat=True)
+        names = {deserialize_image_file(value).name for value in sources}
+        referenced = set(
+            Post.objects.filter(image__in=names).values_list(
+                'image', flat=True
+            )
+        )
+        yield from sorted(names - referenced)
+        chunk = list(islice(keys, chunk_size))
+
+
+def dispose(parts, entry, quarantine=None):
+    """Удаляет осиротевший файл или переносит его в карантин.
+
+    В карантин переносятся только оригиналы: производные файлы
+    можно создать заново.
+    """
+    if is_derived(parts):
+        os.remove(entry.path)
+        return
+    name = '/'.join(parts)
+    delete_derived_files(name)
+    if quarantine is None:
+        default_storage.delete(name)
+        return
+    target = os.path.join(quarantine, *parts)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.move(entry.path, target)
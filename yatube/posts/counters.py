@@ -0,0 +1,91 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Post, Tag, UserStats
+
+
+User = get_user_model()
+
+
+def _shifted(field, delta):
+    if delta < 0:
+        # Дрейф счётчика не должен уводить его ниже нуля.
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def change_user_stats(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя одним UPDATE.
+
+    Строки счётчиков создаются вместе с пользователем; если строки
+    нет (например, пользователь удаляется), сдвиг пропускается.
+    """
+    UserStats.objects.filter(user_id=user_id).update(**{
+        field: _shifted(field, delta) for field, delta in deltas.items()
+    })
+
+
+def change_comment_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=_shifted('comment_count', delta)
+    )
+
+
+def change_tag_counts(tag_ids, delta):
+    Tag.objects.filter(id__in=tag_ids).update(
+        post_count=_shifted('post_count', delta)
+    )
+
+
+def _count_of(queryset, field):
+    """Подзапрос: количество строк queryset для OuterRef('pk')."""
+    counted = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field
+    ).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted), Value(0))
+
+
+def recount_counters(batch_size=1000):
+    """Пересчитывает все счётчики пачками по диапазонам id.
+
+    Возвращает количество обработанных пользователей и постов.
+    """
+    UserStats.objects.bulk_create(
+        [
+            UserStats(user_id=user_id)
+            for user_id in User.objects.filter(
+                stats__isnull=True
+            ).values_list('pk', flat=True)
+        ],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    users = _recount_in_batches(
+        UserStats.objects.all(),
+        batch_size,
+        posts_count=_count_of(Post.objects.all(), 'author'),
+        followers_count=_count_of(Follow.objects.all(), 'author'),
+        following_count=_count_of(Follow.objects.all(), 'user'),
+    )
+    posts = _recount_in_batches(
+        Post.objects.all(),
+        batch_size,
+        comment_count=_count_of(Comment.objects.all(), 'post'),
+    )
+    return users, posts
+
+
+def _recount_in_batches(queryset, batch_size, **counters):
+    total = 0
+    last_pk = None
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return total
+        queryset.filter(pk__in=pks).update(**counters)
+        total += len(pks)
+        last_pk = pks[-1]
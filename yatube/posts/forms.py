@@ -1,4 +1,6 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from .images import prepare_post_image
 from .models import Post, Comment
 
 
@@ -7,6 +9,13 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        # Пережимаем только новый файл, а не уже сохранённую картинку.
+        if isinstance(image, UploadedFile):
+            return prepare_post_image(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
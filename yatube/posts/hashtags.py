@@ -0,0 +1,69 @@
+import re
+
+from .counters import change_tag_counts
+from .models import PostTag, Tag
+
+
+HASHTAG_RE = re.compile(r'(?<![\w#])#(\w+)')
+MAX_TAG_LENGTH = Tag._meta.get_field('name').max_length
+
+
+def extract_tags(text):
+    """Имена хэштегов текста в нижнем регистре, без повторов."""
+    return {
+        name.lower()[:MAX_TAG_LENGTH] for name in HASHTAG_RE.findall(text)
+    }
+
+
+def sync_post_tags(post, created=False):
+    """Приводит теги поста к хэштегам его текста.
+
+    Меняются только разошедшиеся ссылки, счётчики тегов сдвигаются
+    на разницу. Возвращает id добавленных и убранных тегов.
+    """
+    wanted = extract_tags(post.text)
+    current = {} if created else dict(
+        PostTag.objects.filter(post=post).values_list('tag__name', 'tag_id')
+    )
+    added_names = wanted - current.keys()
+    removed = [current[name] for name in current.keys() - wanted]
+    added = []
+    if added_names:
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in added_names], ignore_conflicts=True
+        )
+        added = list(
+            Tag.objects.filter(
+                name__in=added_names
+            ).values_list('id', flat=True)
+        )
+        PostTag.objects.bulk_create(
+            [
+                PostTag(post=post, tag_id=tag_id, pub_date=post.pub_date)
+                for tag_id in added
+            ],
+            ignore_conflicts=True,
+        )
+        change_tag_counts(added, 1)
+    if removed:
+        PostTag.objects.filter(post=post, tag_id__in=removed).delete()
+        change_tag_counts(removed, -1)
+    return added, removed
+
+
+def post_tag_ids(post_id):
+    return list(
+        PostTag.objects.filter(post_id=post_id).values_list(
+            'tag_id', flat=True
+        )
+    )
+
+
+def untag_post(post_id):
+    """Сдвигает счётчики тегов удаляемого поста; ссылки удалит CASCADE.
+
+    Возвращает id его тегов.
+    """
+    tag_ids = post_tag_ids(post_id)
+    change_tag_counts(tag_ids, -1)
+    return tag_ids
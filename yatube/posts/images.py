@@ -0,0 +1,237 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.crypto import constant_time_compare, salted_hmac
+from PIL import Image, ImageOps, features
+
+
+# Параметры сохранения по форматам; метаданные (EXIF и т.п.)
+# не передаются и убираются из info, поэтому в файл не попадают.
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'GIF': {},
+    'WEBP': {'quality': 85},
+}
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+def check_image(upload, image):
+    """Проверки по заголовку, без декодирования картинки."""
+    if upload.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            'Файл больше %(limit)d МБ.',
+            code='file_too_large',
+            params={'limit': settings.POST_IMAGE_MAX_UPLOAD_SIZE // 2 ** 20},
+        )
+    if image.format not in SAVE_OPTIONS:
+        raise ValidationError(
+            'Поддерживаются только JPEG, PNG, GIF и WebP.',
+            code='invalid_format',
+        )
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Слишком большое разрешение: %(width)d×%(height)d.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height},
+        )
+
+
+def prepare_post_image(upload):
+    """Проверяет и пережимает загруженную картинку поста.
+
+    Картинка уменьшается до POST_IMAGE_MAX_SIDE по большей стороне,
+    поворачивается по EXIF и сохраняется заново без метаданных.
+    JPEG декодируется сразу в уменьшенном масштабе, так что память
+    на запрос ограничена размером результата, а не оригинала.
+    Анимированные картинки только проверяются. В имя файла
+    добавляется метка содержимого (content_name).
+    """
+    upload.seek(0)
+    with Image.open(upload) as image:
+        check_image(upload, image)
+        if getattr(image, 'is_animated', False):
+            upload.name = content_name(upload, upload.name)
+            upload.seek(0)
+            return upload
+        image_format = image.format
+        name = '{}.{}'.format(
+            os.path.splitext(os.path.basename(upload.name))[0],
+            EXTENSIONS[image_format],
+        )
+        prepared = File(
+            tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR), name
+        )
+        # Заголовок может быть целым, а данные — обрезанными или битыми;
+        # это выясняется только при декодировании.
+        try:
+            reencode(image, image_format, prepared)
+        except (OSError, Image.DecompressionBombError):
+            prepared.close()
+            raise ValidationError(
+                'Файл повреждён или не является изображением.',
+                code='invalid_image',
+            )
+    prepared.name = content_name(prepared, name)
+    prepared.seek(0)
+    return prepared
+
+
+def content_name(file, name):
+    """Имя файла с меткой содержимого: photo.<md5>.jpg.
+
+    Адреса вариантов картинки строятся по имени и кэшируются навсегда,
+    поэтому другая картинка не должна получить то же имя, даже если
+    прежняя уже удалена. Метка считается один раз при загрузке.
+    """
+    digest = hashlib.md5()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    stem, extension = os.path.splitext(os.path.basename(name))
+    return f'{stem}.{digest.hexdigest()[:12]}{extension}'
+
+
+def reencode(image, image_format, output):
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    image.draft(image.mode, (max_side, max_side))
+    icc_profile = image.info.get('icc_profile')
+    # Сначала уменьшаем, потом поворачиваем: exif_transpose копирует
+    # картинку, и копия полноразмерного оригинала удвоила бы память.
+    # Граница квадратная, поэтому порядок на результат не влияет.
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    image = ImageOps.exif_transpose(image)
+    # PNG и WebP по умолчанию записывают info['exif'] обратно.
+    image.info = {}
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    options = dict(SAVE_OPTIONS[image_format])
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    image.save(output, image_format, **options)
+
+
+def variant_size(alias, width):
+    """Размер варианта картинки или None, если его нет в списке."""
+    (base_width, base_height), widths = settings.POST_IMAGE_VARIANTS.get(
+        alias, ((0, 0), ())
+    )
+    if width not in widths:
+        return None
+    return width, round(width * base_height / base_width)
+
+
+def sign_variant(name, alias, width):
+    value = f'{alias}:{width}:{name}'
+    return salted_hmac('posts.images.variant', value).hexdigest()[:20]
+
+
+def check_variant_signature(signature, name, alias, width):
+    return constant_time_compare(
+        signature, sign_variant(name, alias, width)
+    )
+
+
+def variant_url(name, alias, width):
+    return reverse('posts:image_variant', kwargs={
+        'signature': sign_variant(name, alias, width),
+        'alias': alias,
+        'width': width,
+        'name': name,
+    })
+
+
+def variant_srcset(name, alias):
+    """Значение srcset со всеми разрешёнными ширинами варианта."""
+    _, widths = settings.POST_IMAGE_VARIANTS[alias]
+    return ', '.join(
+        f'{variant_url(name, alias, width)} {width}w' for width in widths
+    )
+
+
+def variant_formats(accept):
+    """Форматы, подходящие клиенту: WebP или JPEG и PNG для прозрачных."""
+    if 'image/webp' in accept and features.check('webp'):
+        return ('WEBP',)
+    return ('JPEG', 'PNG')
+
+
+def variant_path(name, alias, width, image_format):
+    return safe_join(
+        settings.MEDIA_ROOT,
+        settings.POST_IMAGE_VARIANTS_DIR,
+        alias,
+        str(width),
+        f'{name}.{EXTENSIONS[image_format]}',
+    )
+
+
+# Полосы блокировок: одновременные запросы одного варианта ждут
+# первый из них, а не пережимают картинку каждый сам.
+_variant_locks = [threading.Lock() for _ in range(64)]
+
+
+def _cached_variant(name, alias, width, formats):
+    # Вариант старше оригинала остался от прежней картинки с тем же
+    # именем и не годится.
+    source_modified = os.path.getmtime(default_storage.path(name))
+    for image_format in formats:
+        path = variant_path(name, alias, width, image_format)
+        try:
+            if os.path.getmtime(path) >= source_modified:
+                return path, image_format
+        except FileNotFoundError:
+            pass
+    return None
+
+
+def get_variant(name, alias, width, accept):
+    """Путь к файлу варианта картинки на диске и его формат.
+
+    Вариант создаётся при первом запросе и дальше отдаётся с диска.
+    Файл пишется во временный и переименовывается, поэтому другие
+    процессы никогда не видят его недописанным.
+    """
+    formats = variant_formats(accept)
+    cached = _cached_variant(name, alias, width, formats)
+    if cached:
+        return cached
+    path = variant_path(name, alias, width, formats[0])
+    with _variant_locks[hash(path) % len(_variant_locks)]:
+        cached = _cached_variant(name, alias, width, formats)
+        if cached:
+            return cached
+        return _make_variant(name, alias, width, formats)
+
+
+def _make_variant(name, alias, width, formats):
+    size = variant_size(alias, width)
+    with default_storage.open(name) as source, Image.open(source) as image:
+        image_format = formats[0]
+        if image.mode in ('RGBA', 'LA', 'P') and 'PNG' in formats:
+            image_format = 'PNG'
+        image.draft(image.mode, size)
+        image = ImageOps.exif_transpose(image)
+        if image_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        image = ImageOps.fit(image, size, Image.LANCZOS)
+    path = variant_path(name, alias, width, image_format)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path), delete=False
+    ) as output:
+        try:
+            image.save(output, image_format, **SAVE_OPTIONS[image_format])
+        except Exception:
+            os.unlink(output.name)
+            raise
+    os.replace(output.name, path)
+    return path, image_format
@@ -0,0 +1,81 @@
+from django.core.cache import InvalidCacheBackendError, cache, caches
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import KVStoreBase, add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+# Отметка «в базе ключа нет», чтобы не ходить в базу повторно.
+# Живёт недолго: миниатюру может создать другой процесс.
+MISSING = ''
+MISSING_TIMEOUT = 60
+
+
+class KVStore(KVStoreBase):
+    """Хранилище метаданных миниатюр sorl в кэше с базой за ним.
+
+    Значения читаются из кэша, при промахе из таблицы sorl и
+    кладутся в кэш. get_many находит миниатюры целой страницы
+    одним запросом к кэшу и не больше чем одним к базе.
+    """
+
+    @property
+    def cache(self):
+        try:
+            return caches[settings.THUMBNAIL_CACHE]
+        except InvalidCacheBackendError:
+            return cache
+
+    def get_many(self, image_files):
+        """Словарь {ключ файла: найденный файл или None}."""
+        keys = {
+            add_prefix(image_file.key): image_file.key
+            for image_file in image_files
+        }
+        values = self._get_many_raw(list(keys))
+        return {
+            key: deserialize_image_file(values[raw]) if values.get(raw)
+            else None
+            for raw, key in keys.items()
+        }
+
+    def clear(self):
+        prefix = settings.THUMBNAIL_KEY_PREFIX
+        keys = list(self._find_keys_raw(prefix))
+        self.cache.delete_many(keys)
+        KVStoreModel.objects.filter(key__startswith=prefix).delete()
+
+    def _get_many_raw(self, keys):
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            found = dict(
+                KVStoreModel.objects.filter(
+                    key__in=missing
+                ).values_list('key', 'value')
+            )
+            self.cache.set_many(found, settings.THUMBNAIL_CACHE_TIMEOUT)
+            self.cache.set_many(
+                {key: MISSING for key in missing if key not in found},
+                MISSING_TIMEOUT,
+            )
+            values.update(found)
+        return values
+
+    def _get_raw(self, key):
+        return self._get_many_raw([key]).get(key) or None
+
+    def _set_raw(self, key, value):
+        KVStoreModel.objects.update_or_create(
+            key=key, defaults={'value': value}
+        )
+        self.cache.set(key, value, settings.THUMBNAIL_CACHE_TIMEOUT)
+
+    def _delete_raw(self, *keys):
+        KVStoreModel.objects.filter(key__in=keys).delete()
+        self.cache.delete_many(keys)
+
+    def _find_keys_raw(self, prefix):
+        return KVStoreModel.objects.filter(
+            key__startswith=prefix
+        ).values_list('key', flat=True)
@@ -0,0 +1,81 @@
+import shutil
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import SQLiteCache
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает скорость SQLiteCache с LocMemCache и FileBasedCache '
+        'на операциях, которые выполняют ленты: get, get_many, set, '
+        'add и incr.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ops',
+            type=int,
+            default=5000,
+            help='Сколько раз выполнить каждую операцию.'
+        )
+        parser.add_argument(
+            '--value-size',
+            type=int,
+            default=2048,
+            help='Размер значения в байтах (фрагмент ленты — около 2 КБ).'
+        )
+
+    def backends(self, directory):
+        params = {'OPTIONS': {'MAX_ENTRIES': 10 ** 6}}
+        return {
+            'locmem': LocMemCache('benchmark', params),
+            'filebased': FileBasedCache(f'{directory}/files', params),
+            'sqlite': SQLiteCache(f'{directory}/cache.sqlite3', params),
+        }
+
+    def operations(self, cache, ops, value):
+        keys = [f'key:{i}' for i in range(ops)]
+        return (
+            ('set', lambda i: cache.set(keys[i], value)),
+            ('get', lambda i: cache.get(keys[i])),
+            ('get_many', lambda i: cache.get_many(keys[i:i + 10])),
+            ('get miss', lambda i: cache.get(f'missing:{i}')),
+            ('add', lambda i: cache.add(f'lock:{i}', 1)),
+            ('incr', lambda i: cache.incr('counter')),
+        )
+
+    def handle(self, *args, **options):
+        ops = options['ops']
+        value = 'x' * options['value_size']
+        directory = tempfile.mkdtemp()
+        try:
+            backends = self.backends(directory)
+            results = {}
+            for name, cache in backends.items():
+                cache.set('counter', 0, None)
+                for operation, func in self.operations(cache, ops, value):
+                    started = time.perf_counter()
+                    for i in range(ops):
+                        func(i)
+                    elapsed = time.perf_counter() - started
+                    results[name, operation] = elapsed / ops * 10 ** 6
+        finally:
+            shutil.rmtree(directory)
+        operations = dict.fromkeys(operation for _, operation in results)
+        self.stdout.write(
+            'мкс/операцию'.ljust(14)
+            + ''.join(name.rjust(12) for name in backends)
+        )
+        for operation in operations:
+            self.stdout.write(operation.ljust(14) + ''.join(
+                f'{results[name, operation]:12.1f}' for name in backends
+            ))
+        self.stdout.write(
+            'locmem не разделяется между процессами; filebased '
+            'и sqlite общие, атомарные add и incr — только у sqlite.'
+        )
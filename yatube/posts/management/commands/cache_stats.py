@@ -0,0 +1,35 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает попадания и промахи кэша по уровням (L1 процесса '
+        'и общий L2), суммарно по всем процессам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счётчики после вывода.'
+        )
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, 'stats'):
+            raise CommandError(
+                'Кэш по умолчанию не двухуровневый, статистики нет.'
+            )
+        stats = cache.stats()
+        for tier in ('l1', 'l2'):
+            hits = stats[f'{tier}_hits']
+            misses = stats[f'{tier}_misses']
+            total = hits + misses
+            ratio = hits / total * 100 if total else 0
+            self.stdout.write(
+                f'{tier.upper()}: попаданий {hits}, промахов {misses} '
+                f'({ratio:.1f}% попаданий)'
+            )
+        if options['reset']:
+            cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счётчики обнулены.'))
@@ -0,0 +1,105 @@
+import json
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sorl.thumbnail import delete as delete_thumbnails
+
+from posts.cleanup import (
+    dispose, find_orphans, orphaned_thumbnail_sources, walk_media,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из MEDIA_ROOT картинки, на которые не ссылается '
+        'ни один пост, вместе с их миниатюрами и вариантами, '
+        'а также миниатюры, о которых не знает sorl. '
+        'Обходит файлы пачками и запоминает, где остановился.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько файлов проверять одним запросом к базе.'
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд.'
+        )
+        parser.add_argument(
+            '--quarantine',
+            help='Переносить оригиналы в этот каталог, а не удалять.'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.MEDIA_ROOT, '.orphaned_media'),
+            help='Файл, в котором хранится место остановки обхода.'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать обход сначала, а не с места остановки.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать осиротевшие файлы.'
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        after = () if options['restart'] else self.load(checkpoint)
+        checked = removed = freed = 0
+        if not after:
+            # Новый обход: сначала миниатюры картинок, которых уже нет,
+            # их записи в kvstore не дают обходу файлов их удалить.
+            sources = orphaned_thumbnail_sources(options['chunk_size'])
+            for name in list(sources):
+                if options['dry_run']:
+                    self.stdout.write(f'{name} (миниатюры)')
+                else:
+                    delete_thumbnails(name, delete_file=False)
+                removed += 1
+        files = walk_media(after)
+        chunk = list(islice(files, options['chunk_size']))
+        while chunk:
+            for parts, entry in find_orphans(chunk, options['min_age']):
+                size = entry.stat(follow_symlinks=False).st_size
+                if options['dry_run']:
+                    self.stdout.write(os.path.join(*parts))
+                else:
+                    dispose(parts, entry, options['quarantine'])
+                removed += 1
+                freed += size
+            checked += len(chunk)
+            if not options['dry_run']:
+                self.save(checkpoint, chunk[-1][0])
+            chunk = list(islice(files, options['chunk_size']))
+        if os.path.exists(checkpoint) and not options['dry_run']:
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено файлов: {checked}, осиротевших: {removed}, '
+            f'{freed // 1024} КБ.'
+        ))
+
+    def load(self, checkpoint):
+        try:
+            with open(checkpoint) as file:
+                return tuple(json.load(file))
+        except FileNotFoundError:
+            return ()
+
+    def save(self, checkpoint, parts):
+        # Пишем во временный файл и переименовываем, чтобы прерванный
+        # запуск не оставил битую отметку.
+        os.makedirs(os.path.dirname(checkpoint), exist_ok=True)
+        with open(checkpoint + '.tmp', 'w') as file:
+            json.dump(parts, file)
+        os.replace(checkpoint + '.tmp', checkpoint)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import recount_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики постов, подписчиков, подписок '
+        'и комментариев, если они разошлись с данными.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк пересчитывать одним UPDATE.'
+        )
+
+    def handle(self, *args, **options):
+        users, posts = recount_counters(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитаны счётчики: пользователей {users}, постов {posts}.'
+        ))
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.query import ModelIterable
 from django.contrib.auth import get_user_model
 
 
@@ -14,6 +15,20 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для карточек ленты.
+
+        Автор и группа подтягиваются одним JOIN, из таблиц читаются
+        только поля, которые выводит шаблон карточки.
+        """
+        return self.select_related('author', 'group').only(
+            'text', 'pub_date', 'image', 'author', 'group',
+            'author__username', 'author__first_name', 'author__last_name',
+            'group__title', 'group__slug',
+        )
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст поста',
@@ -42,14 +57,40 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comment_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta():
         ordering = ['-pub_date']
+        # Индексы под каждую ленту: общая, группы и автора
+        # сортируются по дате без временного B-дерева.
+        indexes = [
+            models.Index(fields=['pub_date'], name='posts_post_pub_date'),
+            models.Index(
+                fields=['group', 'pub_date'], name='posts_post_group_date'
+            ),
+            models.Index(
+                fields=['author', 'pub_date'], name='posts_post_author_date'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
+class CommentQuerySet(models.QuerySet):
+    def for_page(self):
+        """Комментарии для вывода: автор подтягивается одним JOIN."""
+        return self.select_related('author').only(
+            'text', 'created', 'post', 'author', 'author__username'
+        )
+
+
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
@@ -72,10 +113,33 @@ class Comment(models.Model):
         auto_now_add=True
     )
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created'], name='posts_comment_post_created'
+            ),
+        ]
+
     def __str__(self):
         return self.text[:15]
 
 
+class FollowQuerySet(models.QuerySet):
+    def follow(self, user, author):
+        """Подписывает одним INSERT, повторная подписка игнорируется.
+
+        Возвращает True, если подписка создана.
+        """
+        try:
+            with transaction.atomic():
+                self.create(user=user, author=author)
+        except IntegrityError:
+            return False
+        return True
+
+
 class Follow(models.Model):
     user = models.ForeignKey(
         User,
@@ -87,3 +151,159 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following'
     )
+
+    objects = FollowQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые обновляются вместе с данными.
+
+    Шаблоны берут их отсюда вместо COUNT(*) по постам и подпискам.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class LinkedPostIterable(ModelIterable):
+    def __iter__(self):
+        for entry in super().__iter__():
+            yield entry.post
+
+
+class LinkedPostQuerySet(models.QuerySet):
+    """Таблица ссылок на посты с копией pub_date: ленты, теги."""
+
+    def posts(self):
+        """Записи, которые при чтении отдаются как посты.
+
+        Фильтры и сортировка остаются на таблице ссылок, а пост,
+        его автор и группа подтягиваются одним JOIN.
+        """
+        clone = self.select_related(
+            'post', 'post__author', 'post__group'
+        ).only(
+            'pub_date', 'post',
+            'post__text', 'post__pub_date', 'post__image',
+            'post__author', 'post__group',
+            'post__author__username', 'post__author__first_name',
+            'post__author__last_name',
+            'post__group__title', 'post__group__slug',
+        )
+        clone._iterable_class = LinkedPostIterable
+        return clone
+
+
+class TimelineEntry(models.Model):
+    """Пост в ленте подписок пользователя.
+
+    Записи раскладываются при публикации поста (fan-out on write),
+    поэтому лента подписок читается одним проходом по индексу
+    (user, pub_date) без JOIN через Follow.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField()
+
+    objects = LinkedPostQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='posts_timeline_user_date'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='posts_timeline_user_author'
+            ),
+        ]
+
+
+class TagQuerySet(models.QuerySet):
+    def top(self, limit):
+        """Самые популярные теги по счётчику постов, без подсчёта ссылок."""
+        return self.filter(post_count__gt=0).order_by(
+            '-post_count', 'name'
+        )[:limit]
+
+
+class Tag(models.Model):
+    """Хэштег из текста постов, имя хранится в нижнем регистре."""
+    name = models.CharField('Тег', max_length=50, unique=True)
+    post_count = models.PositiveIntegerField('Постов', default=0)
+
+    objects = TagQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-post_count', 'name'], name='posts_tag_top'
+            ),
+        ]
+
+    def __str__(self):
+        return f'#{self.name}'
+
+
+class PostTag(models.Model):
+    """Пост с тегом; по индексу (tag, pub_date) читается лента тега."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='tag_links'
+    )
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='post_links'
+    )
+    pub_date = models.DateTimeField()
+
+    objects = LinkedPostQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'tag'], name='unique_post_tag'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['tag', 'pub_date', 'post'],
+                name='posts_posttag_tag_date'
+            ),
+        ]
@@ -0,0 +1,161 @@
+"""Кэш целых страниц для анонимных читателей.
+
+Страницы, помеченные cached_page, кэшируются целиком вместе
+с поколениями лент, из которых они собраны. Пока поколения те же,
+страница отдаётся из кэша без запросов к постам и рендеринга;
+по истечении PAGE_CACHE_TIMEOUT она ещё отдаётся, а свежая копия
+собирается в фоне. После изменения лент (новый пост, правка,
+подписка) первый запрос пересобирает страницу сам, чтобы автор
+сразу увидел свою запись, а остальные на это время получают
+прежнюю копию. Если копии ещё нет, одновременные запросы ждут
+одну сборку (см. posts.recompute).
+"""
+import copy
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .caching import get_feed_versions, page_etag
+from .recompute import acquire_lock, release_lock, wait_for
+from .tasks import run_in_background
+
+
+# Параметры, от которых зависит закэшированная страница; запросы
+# с другими параметрами кэш обходят.
+PAGE_PARAMS = ('page', 'after', 'before', 'last')
+
+
+def cached_page(scopes_func):
+    """Помечает view страницей, собранной из лент scopes_func.
+
+    scopes_func(request, *args, **kwargs) возвращает список лент
+    страницы или None, если страницы нет. По нему view получает
+    ETag, а AnonymousPageCacheMiddleware — проверку свежести.
+    """
+    def etag_func(request, *args, **kwargs):
+        scopes = scopes_func(request, *args, **kwargs)
+        if scopes is None:
+            return None
+        return page_etag(request, scopes)
+
+    def decorator(view):
+        view = condition(etag_func=etag_func)(view)
+        view.page_scopes = scopes_func
+        return view
+    return decorator
+
+
+def page_cache_key(request):
+    page = ':'.join(request.GET.get(param, '') for param in PAGE_PARAMS)
+    raw = f'{request.path}|{page}'
+    return f'posts:page:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def is_anonymous(request):
+    # Смотрим на куки, а не на request.user, чтобы не читать сессию.
+    return (
+        request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+        and set(request.GET) <= set(PAGE_PARAMS)
+    )
+
+
+def store_page(key, versions, request, response):
+    """Кладёт ответ в кэш, если он одинаков для всех анонимов."""
+    if (
+        response.status_code != 200
+        or response.streaming
+        or response.cookies
+        or request.META.get('CSRF_COOKIE_USED')
+    ):
+        return
+    # Копия годится только для запросов без кук сессии.
+    patch_vary_headers(response, ('Cookie',))
+    entry = {
+        'versions': versions,
+        'created': time.time(),
+        'response': response,
+    }
+    cache.set(
+        key, entry,
+        settings.PAGE_CACHE_TIMEOUT + settings.PAGE_CACHE_STALE_TIMEOUT,
+    )
+
+
+def refresh_page(key, versions, token, request, view, args, kwargs):
+    try:
+        response = view(request, *args, **kwargs)
+        store_page(key, versions, request, response)
+    finally:
+        release_lock(key, token)
+
+
+def clean_request(request):
+    """Копия запроса для фоновой пересборки, без условных заголовков."""
+    request = copy.copy(request)
+    request.META = {
+        name: value for name, value in request.META.items()
+        if name not in ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+    }
+    return request
+
+
+class AnonymousPageCacheMiddleware:
+    """Отдаёт анонимам закэшированные страницы cached_page.
+
+    Стоит последним: к process_view сессия и пользователь ещё
+    не загружены, а запрос к ним без кук ничего не стоит.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        pending = getattr(request, '_page_cache', None)
+        if pending is not None:
+            key, versions, token = pending
+            store_page(key, versions, request, response)
+            if token is not None:
+                release_lock(key, token)
+        return response
+
+    def process_view(self, request, view, args, kwargs):
+        scopes_func = getattr(view, 'page_scopes', None)
+        if scopes_func is None or not is_anonymous(request):
+            return None
+        scopes = scopes_func(request, *args, **kwargs)
+        if scopes is None:
+            return None
+        key = page_cache_key(request)
+        versions = get_feed_versions(scopes)
+        entry = cache.get(key)
+        if entry is None or entry['versions'] != versions:
+            # Страницы нет или ленты изменились: собираем её в этом
+            # запросе, если её уже не собирает другой.
+            token = acquire_lock(key)
+            if token is not None:
+                request._page_cache = (key, versions, token)
+                return None
+            if entry is None:
+                entry = wait_for(key)
+            if entry is None:
+                request._page_cache = (key, versions, None)
+                return None
+        elif time.time() - entry['created'] > settings.PAGE_CACHE_TIMEOUT:
+            token = acquire_lock(key)
+            if token is not None:
+                run_in_background(
+                    refresh_page, key, versions, token,
+                    clean_request(request), view, args, kwargs,
+                )
+        response = entry['response']
+        return get_conditional_response(
+            request, etag=response.get('ETag'), response=response
+        )
@@ -0,0 +1,214 @@
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import SimpleLazyObject, cached_property
+
+from .caching import get_feed_count
+
+
+def encode_cursor(pub_date, pk):
+    """Упаковывает ключ (pub_date, id) в непрозрачный токен для URL."""
+    raw = f'{pub_date.isoformat()}|{pk}'.encode()
+    return urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора, для битого токена возвращает None."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        pub_date, pk = urlsafe_b64decode(padded).decode().split('|')
+        pub_date, pk = parse_datetime(pub_date), int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError, binascii.Error):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPage(Page):
+    """Страница ленты, полученная по курсору, а не по номеру.
+
+    Номер страницы и общее количество постов неизвестны:
+    навигация идёт только на соседние страницы через токены.
+    """
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Page after cursor>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор ленты постов с поддержкой keyset-пагинации.
+
+    Посты упорядочены по (pub_date, id) по убыванию, поэтому страница
+    после курсора выбирается условием по индексу и одним LIMIT,
+    без OFFSET и без COUNT(*).
+
+    Если передан scope ленты, общее количество постов для номерных
+    страниц берётся из кэша, который обновляют сигналы постов.
+    """
+
+    date_field = 'pub_date'
+    ordering = ('-pub_date', '-id')
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, scope=None, **kwargs):
+        if isinstance(object_list, QuerySet):
+            if object_list.query.order_by:
+                # Лента может задать свой ключ сортировки, например
+                # поля таблицы ленты подписок с теми же значениями.
+                self.ordering = tuple(object_list.query.order_by)
+            else:
+                object_list = object_list.order_by(*self.ordering)
+        super().__init__(object_list, per_page, **kwargs)
+        self.scope = scope
+
+    @cached_property
+    def count(self):
+        if self.scope is None:
+            return Paginator.count.func(self)
+        return get_feed_count(
+            self.scope, lambda: Paginator.count.func(self)
+        )
+
+    def cursor_of(self, obj):
+        if isinstance(obj, dict):
+            # Строка из values(): ключи совпадают с полями сортировки.
+            date_key, pk_key = (field.lstrip('-') for field in self.ordering)
+            return encode_cursor(obj[date_key], obj[pk_key])
+        return encode_cursor(getattr(obj, self.date_field), obj.pk)
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        # Ссылка «Следующая» с обычной страницы сразу переводит ленту
+        # в режим курсора; токен считается только если его отрисуют.
+        page.next_cursor = SimpleLazyObject(
+            lambda: self.cursor_of(page[-1]) if page.has_next() else ''
+        )
+        page.elided_page_range = list(
+            self.get_elided_page_range(page.number)
+        )
+        return page
+
+    def get_elided_page_range(self, number=1, on_each_side=3, on_ends=1):
+        """Номера страниц вокруг текущей с многоточиями на месте пропусков.
+
+        Размер диапазона не зависит от количества страниц:
+        первая и последняя страницы плюс по on_each_side вокруг текущей.
+        """
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < self.num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(
+                self.num_pages - on_ends + 1, self.num_pages + 1
+            )
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+    def _keyset(self, cursor, forward):
+        """Условие «строго после курсора» в порядке ленты или против него."""
+        date_lookup, pk_lookup = (
+            field.lstrip('-') for field in self.ordering
+        )
+        descending = self.ordering[0].startswith('-')
+        op = 'lt' if descending == forward else 'gt'
+        pub_date, pk = cursor
+        # Первое условие отдельно по дате, чтобы база сразу
+        # перешла к курсору по индексу, а не листала ленту с начала.
+        return Q(**{f'{date_lookup}__{op}e': pub_date}) & (
+            Q(**{f'{date_lookup}__{op}': pub_date})
+            | Q(**{f'{pk_lookup}__{op}': pk})
+        )
+
+    def cursor_page(self, after=None, before=None, last=False):
+        """Возвращает страницу постов после (или до) переданного токена.
+
+        last — последняя страница: те же условие и LIMIT, что у
+        ?before=, только от старого конца ленты, без OFFSET.
+        """
+        cursor = decode_cursor(before or after or '')
+        if last:
+            return self._page_before(None)
+        if cursor is None:
+            items = list(self.object_list[:self.per_page + 1])
+            has_more = len(items) > self.per_page
+            items = items[:self.per_page]
+            return CursorPage(
+                items,
+                self,
+                next_cursor=self.cursor_of(items[-1]) if has_more else None,
+            )
+        if before:
+            return self._page_before(cursor)
+        items = list(
+            self.object_list.filter(
+                self._keyset(cursor, True)
+            )[:self.per_page + 1]
+        )
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        return CursorPage(
+            items,
+            self,
+            next_cursor=self.cursor_of(items[-1]) if has_more else None,
+            previous_cursor=self.cursor_of(items[0]) if items else None,
+        )
+
+    def _page_before(self, cursor):
+        """Страница перед курсором, а без курсора — самая последняя."""
+        reverse_ordering = [
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        ]
+        object_list = self.object_list
+        if cursor is not None:
+            object_list = object_list.filter(self._keyset(cursor, False))
+        items = list(
+            object_list.order_by(*reverse_ordering)[:self.per_page + 1]
+        )
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page][::-1]
+        return CursorPage(
+            items,
+            self,
+            next_cursor=(
+                self.cursor_of(items[-1])
+                if items and cursor is not None else None
+            ),
+            previous_cursor=self.cursor_of(items[0]) if has_more else None,
+        )
+
+
+class CommentPaginator(CursorPaginator):
+    """Комментарии поста от старых к новым, страницы по курсору.
+
+    Общее количество берётся из счётчика поста, а не из COUNT(*).
+    """
+
+    date_field = 'created'
+    ordering = ('created', 'id')
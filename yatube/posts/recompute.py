@@ -0,0 +1,148 @@
+"""Пересчёт значений кэша без «толпы» одновременных промахов.
+
+get_or_compute хранит значение вместе со временем его мягкого
+истечения и длительностью расчёта. Незадолго до истечения один из
+запросов со случайным опережением (XFetch) пересчитывает значение
+заранее, остальные в это время получают прежнее. Если значения нет,
+расчёт выполняет один поток процесса (single-flight), а между
+процессами — владелец блокировки в кэше; остальные ждут результат.
+"""
+import math
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.failed = False
+        self.value = None
+
+
+def single_flight(key, func):
+    """Выполняет func() один раз на все потоки, пришедшие с key.
+
+    Потоки, пришедшие во время расчёта, ждут и получают его результат;
+    если расчёт упал, каждый из них пробует сам.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.failed:
+            return func()
+        return flight.value
+    try:
+        flight.value = func()
+    except BaseException:
+        flight.failed = True
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+    return flight.value
+
+
+def in_flight(key):
+    return key in _flights
+
+
+def lock_key(key):
+    return f'{key}:lock'
+
+
+def acquire_lock(key):
+    """Блокировка пересчёта key между процессами; возвращает токен."""
+    token = uuid.uuid4().hex
+    if cache.add(lock_key(key), token, settings.RECOMPUTE_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def release_lock(key, token):
+    # Чужую блокировку (наша истекла и её взял другой) не снимаем.
+    if cache.get(lock_key(key)) == token:
+        cache.delete(lock_key(key))
+
+
+def wait_for(key):
+    """Ждёт, пока владелец блокировки положит key в кэш.
+
+    Возвращает значение из кэша или None, если блокировка снята
+    или истекла, а значения так и нет.
+    """
+    deadline = time.monotonic() + settings.RECOMPUTE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(settings.RECOMPUTE_WAIT_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if cache.get(lock_key(key)) is None:
+            return cache.get(key)
+    return None
+
+
+def expires_soon(expires, delta):
+    """Пора ли пересчитать значение заранее (XFetch).
+
+    Опережение случайно и пропорционально длительности расчёта delta,
+    поэтому пересчёт начинает один запрос, а не все сразу.
+    """
+    if expires is None:
+        return False
+    jitter = -delta * settings.RECOMPUTE_BETA * math.log(
+        1 - random.random()
+    )
+    return time.time() + jitter >= expires
+
+
+def _compute_and_store(key, compute, timeout):
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    expires = None if timeout is None else time.time() + timeout
+    cache.set(key, (value, expires, delta), timeout)
+    return value
+
+
+def _fill(key, compute, timeout, entry):
+    token = acquire_lock(key)
+    if token is not None:
+        try:
+            return _compute_and_store(key, compute, timeout)
+        finally:
+            release_lock(key, token)
+    if entry is not None:
+        # Значение уже пересчитывает другой процесс.
+        return entry[0]
+    entry = wait_for(key)
+    if entry is not None:
+        return entry[0]
+    return _compute_and_store(key, compute, timeout)
+
+
+def get_or_compute(key, compute, timeout):
+    """Значение key из кэша; при промахе или скором истечении —
+    compute(), выполненный одним потоком и одним процессом.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires, delta = entry
+        if not expires_soon(expires, delta) or in_flight(key):
+            return value
+    return single_flight(
+        key, lambda: _fill(key, compute, timeout, entry)
+    )
@@ -0,0 +1,129 @@
+import re
+
+from django.db import connection
+
+from .models import Post
+
+
+SEARCH_TABLE = 'posts_post_fts'
+# Границы найденных слов в сниппете; в шаблоне они заменяются на
+# <mark> уже после экранирования текста поста.
+MARK_START = '\x02'
+MARK_END = '\x03'
+MAX_TERMS = 10
+
+# Окончания русских слов, которые отбрасываются перед поиском по
+# префиксу: встроенного стеммера для русского в FTS5 нет, а так
+# «коты» находит «кот» и «котики».
+ENDINGS = sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ов', 'ев', 'ей', 'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие',
+    'ах', 'ях', 'ам', 'ям', 'ом', 'ем', 'ую', 'юю',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+MIN_STEM = 3
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def stem(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def match_expression(query):
+    """Запрос FTS5 из пользовательской строки или None.
+
+    Берутся только слова, поэтому операторы FTS5 из строки
+    не выполняются. Каждое слово ищется по основе как префикс,
+    все слова должны встретиться в посте.
+    """
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return None
+    return ' '.join(f'"{stem(word)}"*' for word in words[:MAX_TERMS])
+
+
+def index_post(post):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [post.pk]
+        )
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text],
+        )
+
+
+def unindex_post(post_id):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [post_id]
+        )
+
+
+def rebuild_index():
+    """Заполняет поисковый индекс заново из таблицы постов."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, text) '
+            f'SELECT id, text FROM {Post._meta.db_table}'
+        )
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')"
+        )
+        cursor.execute(f'SELECT count(*) FROM {SEARCH_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def matching(queryset, query):
+    """Посты queryset, подходящие под запрос, без ранжирования."""
+    match = match_expression(query)
+    if match is None:
+        return queryset.none()
+    if not is_available():
+        return queryset.filter(text__icontains=query)
+    return queryset.extra(
+        where=[
+            f'{Post._meta.db_table}.id IN (SELECT rowid FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s)'
+        ],
+        params=[match],
+    )
+
+
+def search_posts(query):
+    """Посты по запросу, лучшие по BM25 первыми.
+
+    У каждого поста есть snippet: фрагмент текста с найденными словами,
+    отмеченными MARK_START и MARK_END.
+    """
+    match = match_expression(query)
+    posts = Post.objects.for_feed()
+    if match is None:
+        return posts.none()
+    if not is_available():
+        return posts.filter(text__icontains=query)
+    return posts.extra(
+        tables=[SEARCH_TABLE],
+        where=[
+            f'{SEARCH_TABLE}.rowid = {Post._meta.db_table}.id',
+            f'{SEARCH_TABLE} MATCH %s',
+        ],
+        params=[match],
+        select={
+            'rank': f'bm25({SEARCH_TABLE})',
+            'snippet': f"snippet({SEARCH_TABLE}, 0, %s, %s, '…', 24)",
+        },
+        select_params=[MARK_START, MARK_END],
+        order_by=['rank', '-pub_date'],
+    )
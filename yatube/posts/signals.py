@@ -0,0 +1,230 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete,
+)
+from django.dispatch import receiver
+
+from .caching import (
+    author_scope, bump_feed_versions, change_feed_counts, comments_scope,
+    drop_feed_counts, follow_scope, group_scope, index_scope, post_scope,
+    profile_scope, tag_scope,
+)
+from .cleanup import schedule_image_cleanup
+from .counters import change_comment_count, change_user_stats
+from .models import Comment, Follow, Group, Post, UserStats
+from .tasks import run_in_background
+from .thumbnails import schedule_thumbnails, thumbnails_ready
+from . import hashtags, search, timelines
+
+
+User = get_user_model()
+
+
+def post_scopes(post, group_id):
+    """Ленты, в которые попадает пост."""
+    scopes = [index_scope(), author_scope(post.author_id)]
+    if group_id is not None:
+        scopes.append(group_scope(group_id))
+    # Ленты подписок зависят от поколений лент авторов
+    # (follow_feed_scope), поэтому поштучно по подписчикам их
+    # не сдвигаем.
+    scopes.extend(
+        tag_scope(tag_id) for tag_id in hashtags.post_tag_ids(post.pk)
+    )
+    return scopes
+
+
+# Счётчики обновляются первыми: остальные обработчики,
+# например раскладка по лентам, уже видят новые значения.
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance, created, **kwargs):
+    if created:
+        change_user_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change_user_stats(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(sender, instance, created, **kwargs):
+    if created:
+        change_comment_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_comment_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_created_follow(sender, instance, created, **kwargs):
+    if created:
+        change_user_stats(instance.author_id, followers_count=1)
+        change_user_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    change_user_stats(instance.author_id, followers_count=-1)
+    change_user_stats(instance.user_id, following_count=-1)
+
+
+def image_name(post):
+    # Читаем из __dict__, чтобы не догружать отложенное поле.
+    image = post.__dict__.get('image')
+    return getattr(image, 'name', image) or ''
+
+
+@receiver(post_init, sender=Post)
+def remember_post_state(sender, instance, **kwargs):
+    # Запоминаем исходные группу, картинку и текст: при их смене нужно
+    # поправить счётчики и кэш обеих лент, пересоздать миниатюры
+    # и переиндексировать текст для поиска.
+    instance._initial_group_id = instance.__dict__.get('group_id')
+    instance._initial_image = image_name(instance)
+    instance._initial_text = instance.__dict__.get('text')
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    scopes = post_scopes(instance, instance.group_id)
+    if created:
+        change_feed_counts(scopes, 1)
+    elif instance.group_id != instance._initial_group_id:
+        if instance._initial_group_id is not None:
+            old_group = group_scope(instance._initial_group_id)
+            change_feed_counts([old_group], -1)
+            scopes.append(old_group)
+        if instance.group_id is not None:
+            change_feed_counts([group_scope(instance.group_id)], 1)
+    bump_feed_versions(scopes + [post_scope(instance.pk)])
+    instance._initial_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        timelines.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def image_changed(sender, instance, **kwargs):
+    image = image_name(instance)
+    if image != instance._initial_image:
+        if image:
+            schedule_thumbnails(image)
+        if instance._initial_image:
+            schedule_image_cleanup(instance._initial_image)
+    instance._initial_image = image
+
+
+@receiver(thumbnails_ready)
+def thumbnails_created(sender, image_name, **kwargs):
+    # Ленты и страницы, отрисованные до миниатюры, закэшированы
+    # с заглушкой; новое поколение пересобирает их уже с картинкой.
+    posts = Post.objects.filter(image=image_name).only(
+        'id', 'author_id', 'group_id'
+    )
+    for post in posts:
+        bump_feed_versions(
+            post_scopes(post, post.group_id) + [post_scope(post.pk)]
+        )
+
+
+@receiver(post_delete, sender=Post)
+def image_deleted(sender, instance, **kwargs):
+    if instance._initial_image:
+        schedule_image_cleanup(instance._initial_image)
+
+
+@receiver(post_save, sender=Post)
+def post_text_changed(sender, instance, created, **kwargs):
+    if created or instance.text != instance._initial_text:
+        search.index_post(instance)
+        added, removed = hashtags.sync_post_tags(instance, created)
+        change_feed_counts([tag_scope(tag_id) for tag_id in added], 1)
+        change_feed_counts([tag_scope(tag_id) for tag_id in removed], -1)
+        # Ленты убранных тегов уже сброшены в post_saved.
+        bump_feed_versions([tag_scope(tag_id) for tag_id in added])
+    instance._initial_text = instance.text
+
+
+@receiver(pre_delete, sender=Post)
+def untag_post(sender, instance, **kwargs):
+    # Ссылки на теги удалит каскад до post_delete, поэтому
+    # счётчики и кэш лент тегов правим заранее.
+    scopes = [tag_scope(tag_id) for tag_id in hashtags.untag_post(instance.pk)]
+    change_feed_counts(scopes, -1)
+    bump_feed_versions(scopes)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post_text(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    scopes = post_scopes(instance, instance._initial_group_id)
+    change_feed_counts(scopes, -1)
+    bump_feed_versions(scopes + [post_scope(instance.pk)])
+
+
+@receiver((post_save, post_delete), sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    # Страница поста от комментариев не зависит: они подгружаются
+    # отдельно, и ответ post_comments кэшируется и отдаёт ETag
+    # по поколению комментариев поста.
+    bump_feed_versions([comments_scope(instance.post_id)])
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    # Подписка меняет ленту сразу на все посты автора, поэтому
+    # счётчик проще пересчитать один раз при следующем чтении.
+    drop_feed_counts([follow_scope(instance.user_id)])
+    # Счётчики подписок и подписчиков выводятся в профилях обоих.
+    bump_feed_versions([
+        follow_scope(instance.user_id),
+        profile_scope(instance.user_id),
+        profile_scope(instance.author_id),
+    ])
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timelines.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    timelines.trim(instance.user_id, instance.author_id)
+    followers = timelines.followers_count(instance.author_id)
+    if followers == settings.TIMELINE_FANOUT_THRESHOLD:
+        # До TIMELINE_BACKFILL_LIMIT постов на каждого подписчика —
+        # запрос отписки этого не ждёт. Пока задача не выполнилась,
+        # в лентах подписчиков нет постов автора, написанных, когда
+        # он был «звездой».
+        run_in_background(backfill_former_celebrity, instance.author_id)
+
+
+def backfill_former_celebrity(author_id):
+    if timelines.backfill_followers(author_id):
+        bump_feed_versions([author_scope(author_id)])
+
+
+@receiver((post_save, post_delete), sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Карточки постов ссылаются на группу, а при удалении группы
+    # её посты остаются в общей ленте без неё.
+    bump_feed_versions([index_scope(), group_scope(instance.pk)])
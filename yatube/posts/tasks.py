@@ -0,0 +1,52 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.BACKGROUND_WORKERS,
+    thread_name_prefix='yatube-background',
+)
+
+
+def _run(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s упала', func.__name__)
+
+
+def _run_in_worker(func, *args):
+    try:
+        _run(func, *args)
+    finally:
+        # У потока пула своё соединение с базой, не держим его открытым.
+        close_old_connections()
+
+
+def _runs_eagerly():
+    # Базу SQLite в памяти (например, тестовую) потоки пула делят
+    # с потоком запроса без ожидания блокировок, поэтому там фоновые
+    # задачи выполняются сразу.
+    return settings.BACKGROUND_TASKS_EAGER or (
+        connection.vendor == 'sqlite' and connection.is_in_memory_db()
+    )
+
+
+def run_in_background(func, *args):
+    """Выполняет func(*args) в фоновом потоке после коммита транзакции.
+
+    Запрос не ждёт задачу. При BACKGROUND_TASKS_EAGER задача
+    выполняется сразу после коммита в том же потоке.
+    """
+    def submit():
+        if _runs_eagerly():
+            _run(func, *args)
+        else:
+            _executor.submit(_run_in_worker, func, *args)
+
+    transaction.on_commit(submit)
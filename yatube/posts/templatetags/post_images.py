@@ -0,0 +1,25 @@
+from django import template
+
+from posts import images, thumbnails
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, alias):
+    """Готовая миниатюра картинки поста или None, пока она создаётся."""
+    return thumbnails.post_thumbnail(post, alias)
+
+
+@register.simple_tag
+def prefetch_thumbnails(posts, alias):
+    """Находит миниатюры всей страницы постов до отрисовки карточек."""
+    thumbnails.prefetch_thumbnails(posts, alias)
+    return ''
+
+
+@register.simple_tag
+def post_image_srcset(post, alias):
+    """srcset с подписанными адресами всех ширин варианта картинки."""
+    return images.variant_srcset(post.image.name, alias)
@@ -0,0 +1,18 @@
+from django import template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from posts.search import MARK_END, MARK_START
+
+
+register = template.Library()
+
+
+@register.filter
+def highlight(snippet):
+    """Сниппет поиска: текст экранируется, найденные слова в <mark>."""
+    return mark_safe(
+        escape(snippet).replace(MARK_START, '<mark>').replace(
+            MARK_END, '</mark>'
+        )
+    )
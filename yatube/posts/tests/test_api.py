@@ -0,0 +1,116 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.api import NUM
+from posts.models import Follow, Group, Post
+from posts.thumbnails import generate_thumbnails
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+User = get_user_model()
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class FeedApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Api_reader')
+        cls.author = User.objects.create(username='Api_author')
+        cls.group = Group.objects.create(title='Api_group', slug='api_group')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.posts = [
+            Post.objects.create(
+                text=f'Test_text_{i}', author=cls.author, group=cls.group
+            )
+            for i in range(NUM + 2)
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_feeds_page_by_cursor(self):
+        """Все ленты отдают одни и те же посты и листаются курсором."""
+        ids = [post.id for post in self.posts[::-1]]
+        urls = (
+            reverse('posts:api_index'),
+            reverse('posts:api_group_list', args=[self.group.slug]),
+            reverse('posts:api_profile', args=[self.author.username]),
+            reverse('posts:api_follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.client.get(url, {'fields': 'id'}).json()
+                self.assertEqual(
+                    [post['id'] for post in data['results']], ids[:NUM]
+                )
+                data = self.client.get(
+                    url, {'fields': 'id', 'after': data['next']}
+                ).json()
+                self.assertEqual(
+                    [post['id'] for post in data['results']], ids[NUM:]
+                )
+                self.assertIsNone(data['next'])
+
+    def test_sparse_fields(self):
+        """fields= оставляет в ответе только перечисленные поля."""
+        data = self.client.get(
+            reverse('posts:api_index'), {'fields': 'text,author,group'}
+        ).json()
+        self.assertEqual(data['results'][0], {
+            'text': self.posts[-1].text,
+            'author': self.author.username,
+            'group': self.group.slug,
+        })
+        response = self.client.get(
+            reverse('posts:api_index'), {'fields': 'text,password'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_follow_feed_requires_login(self):
+        response = Client().get(reverse('posts:api_follow_index'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_thumbnails_in_one_query(self):
+        """Миниатюры страницы находятся одним запросом к хранилищу."""
+        for post in self.posts[-3:]:
+            post.image = SimpleUploadedFile(f'api_{post.id}.gif', SMALL_GIF)
+            post.save()
+            generate_thumbnails(post.image.name)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(
+                reverse('posts:api_index'), {'fields': 'id,image,thumbnail'}
+            ).json()
+        self.assertEqual(len(queries), 2)
+        results = data['results']
+        self.assertTrue(all(post['thumbnail'] for post in results[:3]))
+        self.assertTrue(results[0]['image'].startswith(settings.MEDIA_URL))
+        self.assertEqual(results[3], {
+            'id': self.posts[-4].id, 'image': None, 'thumbnail': None,
+        })
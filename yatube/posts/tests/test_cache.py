@@ -1,6 +1,18 @@
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
-from posts.models import Post
+from django.test import (
+    Client, RequestFactory, TestCase, TransactionTestCase,
+)
+from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from posts.caching import (
+    author_scope, bump_feed_version, comments_scope, follow_feed_scope,
+    follow_scope, get_feed_version, group_scope, index_scope,
+)
+from posts.models import Comment, Follow, Post, Group
+from posts.pagecache import page_cache_key
+from posts.recompute import lock_key
 from django.core.cache import cache
 
 
@@ -21,20 +33,326 @@ class CacheTests(TestCase):
         self.guest_client = Client()
 
     def test_cache_2(self):
-        """После удаление поста он остается на странице,
-        после очтстки кэша, удаляется.
+        """Главная страница кэшируется, но после удаления поста
+        сразу отдаётся без него, не дожидаясь истечения кэша.
         """
         response = self.guest_client.get('')
         first_response = response.content
-        CacheTests.post.delete()
         response = self.guest_client.get('')
-        second_response = response.content
+        self.assertEqual(first_response, response.content)
+        CacheTests.post.delete()
+        response_after_delete = self.guest_client.get('')
+        self.assertNotEqual(
+            first_response,
+            response_after_delete.content
+        )
+        self.assertNotIn(b'Test_text', response_after_delete.content)
+
+    def test_signals_bump_generations(self):
+        """Изменения Post, Comment и Follow сдвигают поколения лент."""
+        author = User.objects.create(username='Test_author')
+        group = Group.objects.create(title='Test_title', slug='test_slug')
+        Follow.objects.create(user=CacheTests.user, author=author)
+        scopes = [
+            index_scope(),
+            group_scope(group.id),
+            author_scope(author.id),
+        ]
+        versions = [get_feed_version(scope) for scope in scopes]
+        follow_feed = follow_feed_scope(CacheTests.user.id, [author.id])
+        post = Post.objects.create(author=author, group=group, text='New')
+        self.assertTrue(all(
+            get_feed_version(scope) > version
+            for scope, version in zip(scopes, versions)
+        ))
+        self.assertNotEqual(
+            follow_feed_scope(CacheTests.user.id, [author.id]), follow_feed
+        )
+        comments_version = get_feed_version(comments_scope(post.id))
+        Comment.objects.create(post=post, author=author, text='Comment')
+        self.assertGreater(
+            get_feed_version(comments_scope(post.id)), comments_version
+        )
+        follow_version = get_feed_version(follow_scope(CacheTests.user.id))
+        Follow.objects.filter(user=CacheTests.user).delete()
+        self.assertGreater(
+            get_feed_version(follow_scope(CacheTests.user.id)),
+            follow_version
+        )
+
+
+class FeedCountCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Test_name')
+        cls.group = Group.objects.create(
+            title='Test_title',
+            slug='test_slug'
+        )
+        for i in range(11):
+            Post.objects.create(
+                author=cls.user,
+                group=cls.group,
+                text=f'Test_text_{i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_warm_feeds_do_not_count(self):
+        """Повторный запрос ленты не выполняет COUNT(*)."""
+        # Анонимам страница целиком отдаётся из кэша, поэтому счётчики
+        # проверяем на пользователе, для которого она рендерится.
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.authorized_client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.authorized_client.get(url)
+                self.assertFalse(
+                    any('COUNT(' in query['sql'] for query in queries)
+                )
+                self.assertEqual(
+                    response.context['page_obj'].paginator.count, 11
+                )
+
+    def test_counts_follow_create_and_delete(self):
+        """Создание и удаление поста сдвигают счётчик без пересчёта."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.guest_client.get(url)
+        post = Post.objects.create(
+            author=self.user,
+            group=self.group,
+            text='Test_text_new'
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(url)
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries)
+        )
+        self.assertEqual(response.context['page_obj'].paginator.count, 12)
+        post.delete()
+        response = self.guest_client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 11)
+
+
+class FeedFragmentCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Test_name')
+        cls.group = Group.objects.create(
+            title='Test_title',
+            slug='test_slug'
+        )
+        for i in range(13):
+            Post.objects.create(
+                author=cls.user,
+                group=cls.group if i % 2 else None,
+                text=f'Test_text_{i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_pages_are_cached_separately(self):
+        """Каждая страница ленты кэшируется под своим ключом."""
+        first_page = self.guest_client.get(reverse('posts:index'))
+        second_page = self.guest_client.get(
+            reverse('posts:index'), {'page': 2}
+        )
+        self.assertNotIn(b'Test_text_12', second_page.content)
+        self.assertIn(b'Test_text_12', first_page.content)
+        self.assertIn(b'Test_text_0', second_page.content)
+
+    def test_feeds_are_cached_separately(self):
+        """Разные ленты не отдают фрагменты друг друга."""
+        self.guest_client.get(reverse('posts:index'))
+        response = self.guest_client.get(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        )
+        self.assertNotIn(b'Test_text_12', response.content)
+        self.assertIn(b'Test_text_11', response.content)
+
+    def test_bump_feed_version_drops_fragment(self):
+        """Новое поколение ленты сбрасывает её закэшированные фрагменты."""
+        first_response = self.guest_client.get(reverse('posts:index'))
+        # update() обходит сигналы, поэтому фрагмент остаётся прежним.
+        Post.objects.filter(text='Test_text_12').update(text='Changed')
         self.assertEqual(
-            first_response, second_response
+            self.guest_client.get(reverse('posts:index')).content,
+            first_response.content
         )
+        bump_feed_version(index_scope())
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotIn(b'Test_text_12', response.content)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Test_name')
+        cls.reader = User.objects.create(username='Reader')
+        cls.group = Group.objects.create(
+            title='Test_title',
+            slug='test_slug'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            group=cls.group,
+            text='Test_text'
+        )
+
+    def setUp(self):
         cache.clear()
-        response_after_clear = self.guest_client.get('')
-        self.assertNotEqual(
-            first_response,
-            response_after_clear
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def revalidate(self, client, url):
+        etag = client.get(url)['ETag']
+        return etag, client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_not_modified_without_feed_queries(self):
+        """Совпавший ETag даёт 304 без запросов к постам."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
         )
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse([
+                    query for query in queries.captured_queries
+                    if 'FROM "posts_post"' in query['sql']
+                    and 'LIMIT 1' not in query['sql']
+                ])
+
+    def test_new_post_changes_etag(self):
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        etag, _ = self.revalidate(self.guest_client, url)
+        Post.objects.create(author=self.user, group=self.group, text='New')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_edit_changes_post_etag(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        etag, _ = self.revalidate(self.guest_client, url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Changed'
+        post.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_comment_keeps_post_etag(self):
+        """Комментарии подгружаются отдельно и ETag поста не меняют."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        etag, _ = self.revalidate(self.guest_client, url)
+        Comment.objects.create(post=self.post, author=self.reader, text='C')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_follow_changes_profile_etag(self):
+        """Кнопка подписки и счётчики профиля не залипают в кэше."""
+        url = reverse('posts:profile', kwargs={'username': self.user})
+        etag, response = self.revalidate(self.reader_client, url)
+        self.assertEqual(response.status_code, 304)
+        guest_etag = self.guest_client.get(url)['ETag']
+        self.assertNotEqual(guest_etag, etag)
+        Follow.objects.create(user=self.reader, author=self.user)
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=guest_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_page_has_no_etag(self):
+        response = self.guest_client.get(
+            reverse('posts:group_list', kwargs={'slug': 'missing'})
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Test_name')
+        cls.post = Post.objects.create(author=cls.user, text='Test_text')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_anonymous_hit_skips_database(self):
+        self.guest_client.get(reverse('posts:index'))
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Test_text')
+
+    def test_logged_in_users_bypass_cache(self):
+        self.guest_client.get(reverse('posts:index'))
+        self.assertIsNone(
+            self.guest_client.get(reverse('posts:index')).context
+        )
+        self.authorized_client.get(reverse('posts:index'))
+        self.assertIsNotNone(
+            self.authorized_client.get(reverse('posts:index')).context
+        )
+
+    def test_write_refreshes_page(self):
+        """После изменения ленты первый же запрос видит запись."""
+        url = reverse('posts:profile', kwargs={'username': self.user})
+        self.guest_client.get(url)
+        Post.objects.create(author=self.user, text='New_text')
+        self.assertContains(self.guest_client.get(url), 'New_text')
+
+    def test_refreshing_page_is_served_stale(self):
+        """Пока страницу пересобирает другой запрос, отдаётся копия."""
+        url = reverse('posts:index')
+        lock = lock_key(page_cache_key(RequestFactory().get(url)))
+        self.guest_client.get(url)
+        Post.objects.create(author=self.user, text='New_text')
+        cache.add(lock, True)
+        self.assertNotContains(self.guest_client.get(url), 'New_text')
+        cache.delete(lock)
+        self.assertContains(self.guest_client.get(url), 'New_text')
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class StalePageRefreshTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test_name')
+        self.post = Post.objects.create(author=self.user, text='Test_text')
+        self.guest_client = Client()
+
+    def test_expired_page_is_refreshed_in_background(self):
+        """Устаревшая копия отдаётся, а новая собирается в фоне."""
+        url = reverse('posts:index')
+        key = page_cache_key(RequestFactory().get(url))
+        self.guest_client.get(url)
+        created = cache.get(key)['created']
+        self.assertEqual(self.guest_client.get(url).status_code, 200)
+        self.assertGreater(cache.get(key)['created'], created)
+        self.assertIsNone(cache.get(lock_key(key)))
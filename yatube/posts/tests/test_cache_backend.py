@@ -0,0 +1,183 @@
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from django.utils.safestring import mark_safe
+
+from core.cache import SQLiteCache, TieredCache
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(
+            f'{self.directory}/cache.sqlite3', {'OPTIONS': options}
+        )
+
+    def test_set_get_delete(self):
+        self.cache.set('key', {'value': [1, 2]})
+        self.cache.set('number', 5)
+        self.assertEqual(self.cache.get('key'), {'value': [1, 2]})
+        self.assertEqual(
+            self.cache.get_many(['key', 'number', 'missing']),
+            {'key': {'value': [1, 2]}, 'number': 5}
+        )
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_expired_entries_are_missing(self):
+        self.cache.set('key', 'value', 0)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_add_keeps_live_value(self):
+        self.assertTrue(self.cache.add('key', 'first', None))
+        self.assertFalse(self.cache.add('key', 'second'))
+        self.assertEqual(self.cache.get('key'), 'first')
+
+    def test_incr(self):
+        self.cache.set('number', 1)
+        self.assertEqual(self.cache.incr('number', 4), 5)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('text', 'value')
+        with self.assertRaises(ValueError):
+            self.cache.incr('text')
+
+    def test_processes_share_entries(self):
+        """Экземпляры на одном файле (как воркеры) видят записи друг друга."""
+        other = self.make_cache()
+        self.cache.set('number', 0)
+        self.assertEqual(other.incr('number'), 1)
+        other.clear()
+        self.assertIsNone(self.cache.get('number'))
+
+    def test_concurrent_incr_is_atomic(self):
+        self.cache.set('number', 0)
+
+        def increment():
+            for _ in range(100):
+                self.cache.incr('number')
+
+        threads = [threading.Thread(target=increment) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('number'), 800)
+
+    def test_cull_evicts_least_recently_read(self):
+        cache = self.make_cache(
+            MAX_ENTRIES=10, CULL_FREQUENCY=2, ACCESS_RESOLUTION=0,
+            CULL_CHECK_EVERY=1,
+        )
+        for i in range(10):
+            cache.set(f'key{i}', i)
+        time.sleep(0.01)
+        cache.get('key0')
+        cache.set('key10', 10)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(cache.get('key10'), 10)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'l2': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'l2',
+    },
+})
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['l2'].clear()
+        # Два экземпляра на одном L2 — как два процесса.
+        self.cache = self.make_cache()
+        self.other = self.make_cache()
+
+    def make_cache(self):
+        return TieredCache('l2', {'OPTIONS': {'BROADCAST_INTERVAL': 0}})
+
+    def test_hot_reads_skip_l2(self):
+        self.cache.set('key', 'value')
+        caches['l2'].set('key', 'changed behind the back')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.other.get('key'), 'changed behind the back')
+
+    def test_writes_are_broadcast(self):
+        self.assertIsNone(self.other.get('key'))
+        self.other.set('number', 1)
+        self.assertEqual(self.other.get('number'), 1)
+        self.cache.set('key', 'value')
+        self.cache.incr('number')
+        self.assertEqual(self.other.get('key'), 'value')
+        self.assertEqual(self.other.get('number'), 2)
+        self.cache.delete('key')
+        self.assertIsNone(self.other.get('key'))
+
+    def test_clear_is_broadcast(self):
+        self.other.set('key', 'value')
+        self.cache.clear()
+        self.assertIsNone(self.other.get('key'))
+
+    def test_lost_events_drop_l1(self):
+        """Если события уже вытеснены из L2, L1 очищается целиком."""
+        self.other.set('key', 'value')
+        self.cache.set('key', 'changed')
+        caches['l2'].delete(self.cache.event_key(
+            caches['l2'].get(TieredCache.SEQ_KEY)
+        ))
+        self.assertEqual(self.other.get('key'), 'changed')
+
+    def test_invalidation_during_l2_read_is_kept(self):
+        """Значение, прочитанное из L2 до инвалидации, которую другой
+        поток уже обработал, не остаётся в L1."""
+        self.other.set('key', 'old')
+        l2 = caches['l2']
+        l2_get = l2.get
+
+        def racing_get(key, *args, **kwargs):
+            value = l2_get(key, *args, **kwargs)
+            if key == 'key':
+                self.other.set('key', 'new')
+                self.cache.sync(force=True)
+            return value
+
+        with mock.patch.object(l2, 'get', side_effect=racing_get):
+            self.assertEqual(self.cache.get('key'), 'old')
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_mutable_values_are_not_shared(self):
+        self.cache.set('key', {'items': [1]})
+        self.cache.get('key')['items'].append(2)
+        self.assertEqual(self.cache.get('key'), {'items': [1]})
+
+    def test_fragments_are_not_pickled_in_l1(self):
+        """Фрагменты (SafeText в кортеже XFetch) отдаются из L1 как есть."""
+        fragment = (mark_safe('<article></article>'), None, 0.1)
+        self.cache.set('fragment', fragment)
+        # После pickle.loads вернулась бы копия, а не тот же объект.
+        self.assertIs(self.cache.get('fragment'), fragment)
+
+    def test_stats_per_tier(self):
+        self.cache.reset_stats()
+        self.cache.set('key', 'value')
+        self.cache.get('key')
+        self.other.get('key')
+        self.other.get_many(['key', 'missing'])
+        self.other.sync(force=True)
+        self.assertEqual(self.cache.stats(), {
+            'l1_hits': 2, 'l1_misses': 2, 'l2_hits': 1, 'l2_misses': 1,
+        })
@@ -0,0 +1,132 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts.cleanup import delete_image_files
+from posts.images import get_variant
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails, lookup_thumbnail
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+User = get_user_model()
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaCleanupTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Cleanup_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.post = Post.objects.create(
+            text='Test_text',
+            author=self.user,
+            image=SimpleUploadedFile('kept.gif', SMALL_GIF)
+        )
+
+    def media_file(self, name, content=SMALL_GIF):
+        path = os.path.join(TEMP_MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def test_delete_image_files_removes_derived_files(self):
+        """С картинкой удаляются её миниатюры и варианты."""
+        name = self.post.image.name
+        generate_thumbnails(name)
+        thumbnail = lookup_thumbnail(self.post.image, 'card')
+        variant, _ = get_variant(name, 'card', 480, '')
+        delete_image_files(name)
+        self.assertTrue(self.post.image.storage.exists(name))
+
+        Post.objects.filter(pk=self.post.pk).delete()
+        delete_image_files(name)
+        self.assertFalse(self.post.image.storage.exists(name))
+        self.assertFalse(thumbnail.exists())
+        self.assertFalse(os.path.exists(variant))
+
+    def test_command_removes_only_orphans(self):
+        """Удаляются файлы без постов, в том числе варианты."""
+        orphan = self.media_file('posts/orphan.gif')
+        orphan_variant = self.media_file(
+            'variants/card/480/posts/orphan.gif.jpg'
+        )
+        kept = os.path.join(TEMP_MEDIA_ROOT, self.post.image.name)
+        call_command('collect_orphaned_media', '--chunk-size=1',
+                     '--min-age=0', stdout=StringIO())
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(orphan_variant))
+        self.assertTrue(os.path.exists(kept))
+
+    def test_command_removes_unknown_thumbnails(self):
+        """Миниатюры без записи в kvstore и миниатюры картинок,
+        которых уже нет, удаляются; живые миниатюры остаются."""
+        generate_thumbnails(self.post.image.name)
+        kept = lookup_thumbnail(self.post.image, 'card')
+        unknown = self.media_file('cache/00/00/unknown.jpg')
+        gone = Post.objects.create(
+            text='Test_text',
+            author=self.user,
+            image=SimpleUploadedFile('gone.gif', SMALL_GIF)
+        )
+        generate_thumbnails(gone.image.name)
+        gone_thumbnail = lookup_thumbnail(gone.image, 'card')
+        gone.image.storage.delete(gone.image.name)
+        Post.objects.filter(pk=gone.pk).delete()
+        call_command('collect_orphaned_media', '--chunk-size=1',
+                     '--min-age=0', stdout=StringIO())
+        self.assertTrue(kept.exists())
+        self.assertFalse(os.path.exists(unknown))
+        self.assertFalse(gone_thumbnail.exists())
+
+    def test_command_quarantines_and_resumes(self):
+        """Обход продолжается с сохранённого места, оригиналы
+        переносятся в карантин, а отметка удаляется в конце."""
+        before = self.media_file('posts/a.gif')
+        self.media_file('posts/c.gif')
+        checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'checkpoint')
+        with open(checkpoint, 'w') as file:
+            json.dump(['posts', 'b.gif'], file)
+        quarantine = os.path.join(TEMP_MEDIA_ROOT, 'quarantine')
+        call_command(
+            'collect_orphaned_media', '--min-age=0',
+            f'--checkpoint={checkpoint}', f'--quarantine={quarantine}',
+            stdout=StringIO(),
+        )
+        self.assertTrue(os.path.exists(before))
+        self.assertTrue(
+            os.path.exists(os.path.join(quarantine, 'posts', 'c.gif'))
+        )
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_fresh_files_are_kept(self):
+        """Только что загруженные файлы не считаются осиротевшими."""
+        fresh = self.media_file('posts/fresh.gif')
+        call_command('collect_orphaned_media', stdout=StringIO())
+        self.assertTrue(os.path.exists(fresh))
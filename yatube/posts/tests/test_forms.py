@@ -5,6 +5,8 @@ from posts.forms import PostForm
 from posts.models import Post, Group, Comment
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from io import BytesIO
+from PIL import Image
 import shutil
 import tempfile
 
@@ -89,7 +91,7 @@ class PostCreateFormTests(TestCase):
                 text='Test_text',
                 author=self.user,
                 group=PostCreateFormTests.group,
-                image='posts/small.gif'
+                image__regex=r'^posts/small\.[0-9a-f]{12}\.gif$'
             ).exists()
         )
 
@@ -150,3 +152,83 @@ class PostCreateFormTests(TestCase):
                 author=self.user
             ).exists()
         )
+
+
+def make_upload(name, image_format, size, **save_options):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 0, 0)).save(
+        buffer, image_format, **save_options
+    )
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    POST_IMAGE_MAX_SIDE=100,
+    POST_IMAGE_MAX_PIXELS=1000 * 1000,
+)
+class PostImageUploadTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def clean_image(self, upload):
+        form = PostForm(data={'text': 'Test_text'}, files={'image': upload})
+        return form, form.is_valid()
+
+    def test_image_is_downscaled_rotated_and_stripped(self):
+        """Картинка уменьшается, поворачивается по EXIF и теряет EXIF"""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90°
+        upload = make_upload('photo.jpg', 'JPEG', (400, 200), exif=exif)
+        form, is_valid = self.clean_image(upload)
+        self.assertTrue(is_valid, form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (50, 100))
+            self.assertNotIn('exif', image.info)
+
+    def test_png_metadata_is_stripped(self):
+        """PNG тоже сохраняется без EXIF, хотя кодер пишет его сам"""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'  # Make
+        upload = make_upload('photo.png', 'PNG', (400, 200), exif=exif)
+        form, is_valid = self.clean_image(upload)
+        self.assertTrue(is_valid, form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.format, 'PNG')
+            self.assertEqual(image.size, (100, 50))
+            self.assertNotIn('exif', image.info)
+            self.assertNotIn(0x010F, image.getexif())
+
+    def test_too_many_pixels_is_rejected(self):
+        """Разрешение проверяется по заголовку файла"""
+        upload = make_upload('huge.png', 'PNG', (2000, 1000))
+        form, is_valid = self.clean_image(upload)
+        self.assertFalse(is_valid)
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code, 'too_many_pixels'
+        )
+
+    def test_unsupported_format_is_rejected(self):
+        """Принимаются только форматы из списка"""
+        upload = make_upload('image.bmp', 'BMP', (10, 10))
+        form, is_valid = self.clean_image(upload)
+        self.assertFalse(is_valid)
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code, 'invalid_format'
+        )
+
+    def test_truncated_image_is_rejected(self):
+        """Обрезанный файл с целым заголовком — ошибка формы, а не 500"""
+        buffer = BytesIO()
+        Image.effect_noise((400, 400), 64).convert('RGB').save(
+            buffer, 'JPEG'
+        )
+        upload = SimpleUploadedFile('cut.jpg', buffer.getvalue()[:3000])
+        form, is_valid = self.clean_image(upload)
+        self.assertFalse(is_valid)
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code, 'invalid_image'
+        )
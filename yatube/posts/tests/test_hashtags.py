@@ -0,0 +1,79 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.hashtags import extract_tags
+from posts.models import Post, PostTag, Tag
+from posts.views import NUM
+
+User = get_user_model()
+
+
+class HashtagTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Tag_author')
+
+    def setUp(self):
+        cache.clear()
+
+    def counts(self):
+        return dict(Tag.objects.values_list('name', 'post_count'))
+
+    def test_extract_tags(self):
+        """Теги нормализуются, повторы и #внутри слов не считаются."""
+        self.assertEqual(
+            extract_tags('#Котики и #котики, #сон_днём, a#b ##c'),
+            {'котики', 'сон_днём'}
+        )
+
+    def test_edit_updates_links_by_diff(self):
+        """Правка поста меняет только разошедшиеся ссылки."""
+        post = Post.objects.create(text='#кот #пёс', author=self.user)
+        kept = PostTag.objects.get(post=post, tag__name='кот')
+        post.text = '#кот #попугай'
+        post.save()
+        self.assertTrue(PostTag.objects.filter(pk=kept.pk).exists())
+        self.assertEqual(
+            set(post.tag_links.values_list('tag__name', flat=True)),
+            {'кот', 'попугай'}
+        )
+        self.assertEqual(
+            self.counts(), {'кот': 1, 'пёс': 0, 'попугай': 1}
+        )
+        post.delete()
+        self.assertEqual(self.counts(), {'кот': 0, 'пёс': 0, 'попугай': 0})
+
+    def test_tag_feed_and_top_tags(self):
+        """Лента тега читается по его индексу, топ тегов на главной."""
+        posts = [
+            Post.objects.create(text=f'Пост {i} #кот', author=self.user)
+            for i in range(NUM + 2)
+        ]
+        Post.objects.create(text='#пёс', author=self.user)
+        client = Client()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(
+                reverse('posts:tag_posts', args=['Кот'])
+            )
+        self.assertEqual(
+            list(response.context['page_obj']), posts[::-1][:NUM]
+        )
+        self.assertTrue(any(
+            'posts_posttag' in query['sql'] and 'posts_post"' in query['sql']
+            for query in queries.captured_queries
+        ))
+        next_page = client.get(
+            reverse('posts:tag_posts', args=['кот']),
+            {'after': response.context['page_obj'].next_cursor}
+        )
+        self.assertEqual(list(next_page.context['page_obj']), posts[1::-1])
+        top_tags = client.get(reverse('posts:index')).context['top_tags']
+        self.assertEqual(
+            [(tag.name, tag.post_count) for tag in top_tags],
+            [('кот', NUM + 2), ('пёс', 1)]
+        )
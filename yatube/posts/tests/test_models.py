@@ -1,6 +1,10 @@
-from django.test import TestCase
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase
 from django.contrib.auth import get_user_model
-from ..models import Group, Post, Comment
+from django.urls import reverse
+from ..models import Group, Post, Comment, Follow, UserStats
 
 
 User = get_user_model()
@@ -113,3 +117,62 @@ class PostModelTest(TestCase):
             'Введите текст комментария',
             'Поле help_text модели Comment не соответствует ожиданиям'
         )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='user')
+        cls.author = User.objects.create_user(username='author')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(CountersTest.user)
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_post_and_comment_counters(self):
+        """Счётчики постов и комментариев следуют за созданием и удалением."""
+        post = Post.objects.create(author=self.author, text='Text')
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.id}),
+            data={'text': 'Comment'}
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_follow_counters(self):
+        """Подписка и отписка меняют счётчики подписчиков и подписок."""
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}
+        ))
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.user).following_count, 1)
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author}
+        ))
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.user).following_count, 0)
+
+    def test_recount_counters_repairs_drift(self):
+        """Команда recount_counters исправляет разошедшиеся счётчики."""
+        post = Post.objects.create(author=self.author, text='Text')
+        Comment.objects.create(post=post, author=self.user, text='Comment')
+        Follow.objects.create(user=self.user, author=self.author)
+        UserStats.objects.update(
+            posts_count=7, followers_count=7, following_count=7
+        )
+        Post.objects.update(comment_count=7)
+        call_command('recount_counters', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.author).following_count, 0)
+        self.assertEqual(self.stats(self.user).following_count, 1)
+        self.assertEqual(self.stats(self.user).posts_count, 0)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
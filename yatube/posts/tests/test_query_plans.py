@@ -0,0 +1,78 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.models import Post, Group, Follow
+
+
+User = get_user_model()
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\S+$')
+
+
+class QueryPlanTests(TestCase):
+    """Запросы лент не делают полный проход по таблице
+    и не сортируют результат во временном B-дереве.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test_name')
+        cls.author = User.objects.create_user(username='Test_author')
+        cls.group = Group.objects.create(
+            title='Test_title',
+            slug='test_slug'
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for i in range(15):
+            Post.objects.create(
+                author=cls.author,
+                group=cls.group,
+                text=f'Test_text_{i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(QueryPlanTests.user)
+
+    def query_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_indexed(self, url, params=None, seek=False):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url, params)
+        for query in queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            for step in self.query_plan(query['sql']):
+                with self.subTest(url=url, step=step, sql=query['sql']):
+                    self.assertNotIn('TEMP B-TREE', step)
+                    self.assertIsNone(FULL_SCAN.match(step))
+                    if seek:
+                        self.assertFalse(step.startswith('SCAN'))
+        return response
+
+    def test_feed_query_plans(self):
+        """Ленты читаются по индексам, а страница по курсору
+        начинается сразу с нужного места индекса.
+        """
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            page_obj = self.assert_indexed(url).context['page_obj']
+            self.assert_indexed(url, {'page': 2})
+            self.assert_indexed(
+                url, {'after': str(page_obj.next_cursor)}, seek=True
+            )
@@ -0,0 +1,76 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from posts.recompute import (
+    acquire_lock, expires_soon, get_or_compute, release_lock, single_flight,
+)
+
+
+class RecomputeTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value='value', delay=0):
+        self.calls += 1
+        time.sleep(delay)
+        return value
+
+    def test_single_flight_coalesces_threads(self):
+        """Одновременные промахи в процессе ждут один расчёт."""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                single_flight('key', lambda: self.compute(delay=0.2))
+            ))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['value'] * 5)
+
+    def test_value_is_computed_once(self):
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'value')
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'value')
+        self.assertEqual(self.calls, 1)
+
+    @override_settings(RECOMPUTE_WAIT_INTERVAL=0.01)
+    def test_waits_for_lock_owner(self):
+        """Промах ждёт значение от процесса, держащего блокировку."""
+        token = acquire_lock('key')
+
+        def other_process():
+            cache.set('key', ('other', None, 0))
+            release_lock('key', token)
+
+        timer = threading.Timer(0.1, other_process)
+        timer.start()
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'other')
+        timer.join()
+        self.assertEqual(self.calls, 0)
+
+    def test_stale_value_while_locked(self):
+        """Пока значение пересчитывает другой, отдаётся прежнее."""
+        cache.set('key', ('old', time.time() - 1, 0.1))
+        acquire_lock('key')
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'old')
+        self.assertEqual(self.calls, 0)
+
+    def test_early_refresh(self):
+        """Незадолго до истечения значение пересчитывается заранее."""
+        cache.set('key', ('old', time.time() - 1, 0.1))
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'value')
+        self.assertEqual(cache.get('key')[0], 'value')
+
+    def test_expires_soon(self):
+        now = time.time()
+        self.assertFalse(expires_soon(None, 1))
+        self.assertFalse(expires_soon(now + 3600, 0.01))
+        self.assertTrue(expires_soon(now - 1, 0.01))
@@ -0,0 +1,79 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Post
+from posts.search import search_posts
+from posts.views import NUM
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Search_author')
+        cls.cat = Post.objects.create(
+            text='Мой кот спит весь день',
+            author=cls.user
+        )
+        cls.cats = Post.objects.create(
+            text='Котики и коты, коты и котики',
+            author=cls.user
+        )
+        cls.dog = Post.objects.create(
+            text='Собака гуляет <script>alert(1)</script>',
+            author=cls.user
+        )
+
+    def test_russian_word_forms_and_ranking(self):
+        """Находятся другие формы слова, частые совпадения выше."""
+        self.assertEqual(list(search_posts('коты')), [self.cats, self.cat])
+        self.assertEqual(list(search_posts('собаками')), [self.dog])
+        self.assertEqual(list(search_posts('"OR" *')), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при правке и удалении поста."""
+        dog = Post.objects.get(pk=self.dog.pk)
+        dog.text = 'Теперь здесь про попугая'
+        dog.save()
+        self.assertEqual(list(search_posts('собака')), [])
+        self.assertEqual(list(search_posts('попугай')), [dog])
+        dog.delete()
+        self.assertEqual(list(search_posts('попугай')), [])
+
+    def test_search_page_escapes_and_highlights(self):
+        """Сниппет экранирует текст и выделяет найденные слова."""
+        response = Client().get(reverse('posts:search'), {'q': 'собака'})
+        self.assertContains(response, '<mark>Собака</mark>')
+        self.assertContains(response, '&lt;script&gt;')
+        self.assertNotContains(response, '<script>alert')
+
+    def test_search_page_is_paginated(self):
+        """Результаты разбиты на страницы, запрос сохраняется в ссылках."""
+        Post.objects.bulk_create(
+            Post(text=f'Попугай номер {i}', author=self.user)
+            for i in range(NUM + 1)
+        )
+        call_command('rebuild_search_index', stdout=StringIO())
+        response = Client().get(reverse('posts:search'), {'q': 'попугай'})
+        self.assertEqual(len(response.context['page_obj']), NUM)
+        self.assertContains(response, '?q=%D0%BF%D0%BE%D0%BF')
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по полнотекстовому индексу."""
+        admin = User.objects.create_superuser(
+            'search_admin', 'admin@example.com', 'password'
+        )
+        client = Client()
+        client.force_login(admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'котами'}
+        )
+        self.assertEqual(
+            set(response.context['cl'].result_list), {self.cat, self.cats}
+        )
@@ -0,0 +1,208 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image, features
+
+from posts.images import (
+    prepare_post_image, variant_path, variant_srcset, variant_url,
+)
+from posts.models import Post
+from posts.thumbnails import (
+    generate_thumbnails, lookup_thumbnail, prefetch_thumbnails,
+)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+User = get_user_model()
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Thumb_author')
+        cls.post = Post.objects.create(
+            text='Test_text',
+            author=cls.user,
+            image=SimpleUploadedFile(
+                name='thumb.gif',
+                content=SMALL_GIF,
+                content_type='image/gif'
+            )
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        """Пока миниатюры нет, страница показывает заглушку."""
+        response = Client().get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        )
+        self.assertTemplateUsed(
+            response, 'posts/includes/image_placeholder.html'
+        )
+        self.assertIsNone(lookup_thumbnail(self.post.image, 'card'))
+
+    def test_lookup_finds_generated_thumbnail(self):
+        """После генерации миниатюра находится без обработки картинки."""
+        generate_thumbnails(self.post.image.name)
+        thumbnail = lookup_thumbnail(self.post.image, 'card')
+        self.assertIsNotNone(thumbnail)
+        response = Client().get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        )
+        self.assertContains(response, thumbnail.url)
+        self.assertTemplateNotUsed(
+            response, 'posts/includes/image_placeholder.html'
+        )
+
+    def test_generated_thumbnail_replaces_cached_placeholder(self):
+        """Лента, закэшированная с заглушкой, после генерации миниатюры
+        пересобирается уже с картинкой.
+        """
+        response = Client().get(reverse('posts:index'))
+        self.assertTemplateUsed(
+            response, 'posts/includes/image_placeholder.html'
+        )
+        generate_thumbnails(self.post.image.name)
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(
+            response, lookup_thumbnail(self.post.image, 'card').url
+        )
+
+    def test_feed_resolves_thumbnails_in_one_query(self):
+        """Лента находит миниатюры всех постов страницы одним запросом."""
+        for i in range(3):
+            post = Post.objects.create(
+                text=f'Test_text_{i}',
+                author=self.user,
+                image=SimpleUploadedFile(
+                    name=f'thumb_{i}.gif',
+                    content=SMALL_GIF,
+                    content_type='image/gif'
+                )
+            )
+            generate_thumbnails(post.image.name)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(reverse('posts:index'))
+        kvstore_queries = [
+            query for query in queries.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        self.assertEqual(response.content.count(b'<img class="card-img'), 3)
+
+    def test_prefetch_marks_missing_thumbnails(self):
+        """Пост без готовой миниатюры получает None и заглушку."""
+        post = Post.objects.get(pk=self.post.pk)
+        prefetch_thumbnails([post], 'card')
+        self.assertEqual(post.thumbnails, {'card': None})
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageVariantTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), (0, 120, 0)).save(buffer, 'JPEG')
+        cls.post = Post.objects.create(
+            text='Test_text',
+            author=User.objects.create(username='Variant_author'),
+            image=SimpleUploadedFile('photo.jpg', buffer.getvalue())
+        )
+        cls.name = cls.post.image.name
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_variant_is_resized_cached_and_negotiated(self):
+        """Вариант нужного размера, в WebP для клиентов с его поддержкой,
+        создаётся один раз и кэшируется навсегда."""
+        image_format = 'WEBP' if features.check('webp') else 'JPEG'
+        url = variant_url(self.name, 'card', 480)
+        response = Client().get(url, HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(response['Content-Type'], Image.MIME[image_format])
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept', response['Vary'])
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as im:
+            self.assertEqual(im.size, (480, 170))
+        path = variant_path(self.name, 'card', 480, image_format)
+        modified = os.path.getmtime(path)
+        Client().get(url, HTTP_ACCEPT='image/webp').close()
+        self.assertEqual(os.path.getmtime(path), modified)
+
+        response = Client().get(url, HTTP_ACCEPT='image/*')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        response.close()
+
+    def test_unsigned_or_unknown_variant_is_not_found(self):
+        """Подделанная подпись и неразрешённая ширина дают 404."""
+        url = variant_url(self.name, 'card', 480)
+        self.assertEqual(
+            Client().get(url.replace('/480/', '/960/')).status_code, 404
+        )
+        self.assertEqual(
+            Client().get(url.replace('/480/', '/500/')).status_code, 404
+        )
+
+    def test_new_content_gets_new_name(self):
+        """Другая картинка под тем же именем файла получает другое имя,
+        а адрес варианта строится без обращений к хранилищу."""
+        names = []
+        for color in ((0, 120, 0), (200, 0, 0)):
+            buffer = BytesIO()
+            Image.new('RGB', (1200, 800), color).save(buffer, 'JPEG')
+            upload = SimpleUploadedFile('photo.jpg', buffer.getvalue())
+            names.append(prepare_post_image(upload).name)
+        self.assertNotEqual(names[0], names[1])
+        self.assertRegex(names[0], r'^photo\.[0-9a-f]{12}\.jpg$')
+        with mock.patch.object(
+            FileSystemStorage, 'size', side_effect=AssertionError
+        ), mock.patch.object(
+            FileSystemStorage, 'get_modified_time', side_effect=AssertionError
+        ):
+            self.assertNotEqual(
+                variant_srcset(names[0], 'card'),
+                variant_srcset(names[1], 'card'),
+            )
+
+    def test_feed_emits_srcset(self):
+        """Карточка поста перечисляет все ширины варианта в srcset."""
+        generate_thumbnails(self.name)
+        response = Client().get(reverse('posts:index'))
+        for width in settings.POST_IMAGE_VARIANTS['card'][1]:
+            self.assertContains(
+                response, f'{variant_url(self.name, "card", width)} {width}w'
+            )
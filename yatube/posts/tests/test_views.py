@@ -4,9 +4,17 @@ from django.conf import settings
 from django.urls import reverse
 from django import forms
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client, override_settings
-from posts.models import Post, Group, Follow, Comment
+from django.test import (
+    TestCase, TransactionTestCase, Client, override_settings,
+)
+from posts.models import Post, Group, Follow, Comment, TimelineEntry
+from posts.caching import follow_scope, get_feed_version
+from posts.paginators import CursorPaginator
+from posts.views import COMMENTS_NUM, NUM
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -247,6 +255,290 @@ class PaginatorViewsTest(TestCase):
                         )
 
 
+class ElidedPageRangeTest(TestCase):
+    def test_elided_page_range_is_windowed(self):
+        """Номера страниц выводятся окном вокруг текущей."""
+        paginator = CursorPaginator(range(50000 * NUM), NUM)
+        ellipsis = CursorPaginator.ELLIPSIS
+        cases = {
+            1: [1, 2, 3, 4, ellipsis, 50000],
+            100: [1, ellipsis, 97, 98, 99, 100, 101, 102, 103, ellipsis,
+                  50000],
+            50000: [1, ellipsis, 49997, 49998, 49999, 50000],
+        }
+        for number, expected in cases.items():
+            with self.subTest(number=number):
+                self.assertEqual(
+                    list(paginator.get_elided_page_range(number)), expected
+                )
+        self.assertEqual(
+            list(CursorPaginator(range(3 * NUM), NUM).get_elided_page_range()),
+            [1, 2, 3]
+        )
+
+
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(
+            username='Test_name'
+        )
+        cls.group = Group.objects.create(
+            title='Test_title',
+            slug='test_slug'
+        )
+        for i in range(23):
+            Post.objects.create(
+                text=f'Test_text_{i + 1}',
+                group=cls.group,
+                author=cls.user,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.user = CursorPaginatorViewsTest.user
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_cursor_pages_follow_each_other(self):
+        """Курсоры ?after= и ?before= листают ленту без пропусков."""
+        lst_reverse_name = [
+            reverse('posts:index'),
+            reverse(
+                'posts:group_list',
+                kwargs={'slug': CursorPaginatorViewsTest.group.slug}),
+            reverse(
+                'posts:profile', kwargs={'username': self.user}),
+        ]
+        for reverse_name in lst_reverse_name:
+            with self.subTest(reverse_name=reverse_name):
+                first_page = self.authorized_client.get(
+                    reverse_name
+                ).context['page_obj']
+                second_page = self.authorized_client.get(
+                    reverse_name, {'after': str(first_page.next_cursor)}
+                ).context['page_obj']
+                third_page = self.authorized_client.get(
+                    reverse_name, {'after': second_page.next_cursor}
+                ).context['page_obj']
+                self.assertEqual(
+                    list(second_page),
+                    list(self.authorized_client.get(
+                        reverse_name, {'page': 2}
+                    ).context['page_obj'])
+                )
+                self.assertEqual(len(third_page), 3)
+                self.assertFalse(third_page.has_next())
+                back_page = self.authorized_client.get(
+                    reverse_name, {'before': third_page.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(back_page), list(second_page))
+
+    def test_cursor_page_without_count(self):
+        """Страница по курсору не выполняет COUNT(*)."""
+        first_page = self.authorized_client.get(
+            reverse('posts:index')
+        ).context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(
+                reverse('posts:index'), {'after': str(first_page.next_cursor)}
+            )
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries)
+        )
+
+    def test_last_page_is_read_from_the_end(self):
+        """«Последняя» — самые старые посты одним LIMIT, без OFFSET
+        и COUNT(*), а «Предыдущая» с неё ведёт по курсору."""
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, '?last=1')
+        with CaptureQueriesContext(connection) as queries:
+            last_page = self.authorized_client.get(
+                reverse('posts:index'), {'last': 1}
+            ).context['page_obj']
+        self.assertEqual(
+            [post.text for post in last_page],
+            [f'Test_text_{i}' for i in range(10, 0, -1)]
+        )
+        self.assertFalse(last_page.has_next())
+        self.assertFalse(any(
+            'OFFSET' in query['sql'] or 'COUNT(' in query['sql']
+            for query in queries
+        ))
+        previous_page = self.authorized_client.get(
+            reverse('posts:index'), {'before': last_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            [post.text for post in previous_page],
+            [f'Test_text_{i}' for i in range(20, 10, -1)]
+        )
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый токен курсора открывает первую страницу ленты."""
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'after': 'broken'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(
+            username='Test_name'
+        )
+        cls.group = Group.objects.create(
+            title='Test_title',
+            slug='test_slug'
+        )
+        cls.author = User.objects.create(
+            username='Test_author',
+            first_name='Test_first_name',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        self.user = FeedQueriesTest.user
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def count_feed_queries(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:follow_index'),
+        )
+        counts = {}
+        for url in urls:
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.authorized_client.get(url)
+            counts[url] = len(queries)
+        return counts
+
+    def test_feed_query_count_does_not_grow_with_posts(self):
+        """Число запросов ленты не зависит от количества постов."""
+        Post.objects.create(
+            text='Test_text_0', author=self.author, group=self.group
+        )
+        expected = self.count_feed_queries()
+        for i in range(1, NUM):
+            group = Group.objects.create(
+                title=f'Test_title_{i}', slug=f'test_slug_{i}'
+            )
+            Post.objects.create(
+                text=f'Test_text_{i}', author=self.author, group=group
+            )
+        self.assertEqual(self.count_feed_queries(), expected)
+
+
+class CommentsViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Test_name')
+        cls.post = Post.objects.create(text='Test_text', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def add_comments(self, count):
+        start = Comment.objects.count()
+        for i in range(start, start + count):
+            Comment.objects.create(
+                post=self.post,
+                author=User.objects.create(username=f'Commenter_{i}'),
+                text=f'Test_comment_{i}'
+            )
+
+    def get_comments(self, headers=None, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(
+                reverse('posts:post_comments', args=[self.post.pk]), params,
+                **(headers or {})
+            )
+        return response, len(queries)
+
+    def test_comment_queries_do_not_grow(self):
+        """Авторы комментариев подтягиваются JOIN, без запроса на каждого."""
+        self.add_comments(2)
+        _, few = self.get_comments()
+        self.add_comments(COMMENTS_NUM)
+        _, many = self.get_comments()
+        self.assertEqual(few, many)
+
+    def test_comments_load_more_by_cursor(self):
+        """Комментарии идут от старых к новым, следующие по курсору."""
+        self.add_comments(COMMENTS_NUM + 3)
+        comments = list(
+            Comment.objects.order_by('created', 'id').values_list(
+                'text', flat=True
+            )
+        )
+        data = self.get_comments()[0].json()
+        self.assertEqual(data['count'], COMMENTS_NUM + 3)
+        self.assertTrue(data['has_more'])
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']],
+            comments[:COMMENTS_NUM]
+        )
+        data = self.get_comments(after=data['cursor'])[0].json()
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']],
+            comments[COMMENTS_NUM:]
+        )
+        self.assertFalse(data['has_more'])
+
+    def test_poll_since_returns_only_new_comments(self):
+        """Опрос с since отдаёт только новые комментарии и их курсор."""
+        self.add_comments(2)
+        cursor = self.get_comments()[0].json()['cursor']
+        data = self.get_comments(since=cursor)[0].json()
+        self.assertEqual((data['comments'], data['cursor']), ([], cursor))
+        self.add_comments(1)
+        response, _ = self.get_comments(since=cursor, format='html')
+        self.assertContains(response, 'Test_comment_2')
+        self.assertNotContains(response, 'Test_comment_1')
+
+    def test_poll_without_new_comments_is_not_modified(self):
+        """Опрос без новых комментариев — 304 или кэш, без запросов к базе."""
+        self.add_comments(2)
+        response, _ = self.get_comments(since='')
+        etag = response['ETag']
+        response, queries = self.get_comments(
+            {'HTTP_IF_NONE_MATCH': etag}, since=''
+        )
+        self.assertEqual((response.status_code, queries), (304, 0))
+        response, queries = self.get_comments(since='')
+        self.assertEqual((response.status_code, queries), (200, 0))
+        self.add_comments(1)
+        response, _ = self.get_comments(
+            {'HTTP_IF_NONE_MATCH': etag}, since=''
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['count'], 3)
+
+    def test_post_detail_does_not_render_comments(self):
+        """Страница поста не зависит от комментариев и не читает их."""
+        self.add_comments(1)
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(
+                reverse('posts:post_detail', args=[self.post.pk])
+            )
+        self.assertNotContains(response, 'Test_comment_0')
+        self.assertContains(
+            response, reverse('posts:post_comments', args=[self.post.pk])
+        )
+        self.assertFalse(any(
+            'posts_comment' in query['sql']
+            for query in queries.captured_queries
+        ))
+
+
 class PostViewsFollow(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -307,6 +599,25 @@ class PostViewsFollow(TestCase):
             ).exists()
         )
 
+    def test_follow_twice(self):
+        """Повторная подписка не создаёт дубликат."""
+        url = reverse(
+            'posts:profile_follow',
+            kwargs={'username': PostViewsFollow.author.username}
+        )
+        self.authorized_client.get(url)
+        self.authorized_client.get(url)
+        self.assertEqual(
+            Follow.objects.filter(
+                user=self.user,
+                author=PostViewsFollow.author
+            ).count(),
+            1
+        )
+        self.assertFalse(
+            Follow.objects.follow(self.user, PostViewsFollow.author)
+        )
+
     def test_follow_not_himself(self):
         """Автор не может подписаться сам на себя"""
         self.authorized_client.get(
@@ -366,3 +677,134 @@ class PostViewsFollow(TestCase):
                 author=self.user
             ).exists()
         )
+
+
+class TimelineViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(
+            username='Test_name'
+        )
+        cls.author = User.objects.create(
+            username='Test_author'
+        )
+        cls.old_post = Post.objects.create(
+            text='Test_text_old',
+            author=cls.author,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.user = TimelineViewsTest.user
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        """Подписка добавляет посты автора в ленту, отписка убирает."""
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.user, post=self.old_post
+            ).exists()
+        )
+        Follow.objects.filter(user=self.user, author=self.author).delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user).exists()
+        )
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост раскладывается в ленты подписчиков."""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Test_text_new', author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists()
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [post, self.old_post]
+        )
+
+    def test_follow_feed_is_single_timeline_query(self):
+        """Лента подписок читается из таблицы ленты без JOIN по Follow."""
+        Follow.objects.create(user=self.user, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(reverse('posts:follow_index'))
+        feed_queries = [
+            query['sql'] for query in queries
+            if 'FROM "posts_timelineentry"' in query['sql']
+            and 'ORDER BY' in query['sql']
+        ]
+        self.assertEqual(len(feed_queries), 1)
+        self.assertNotIn('posts_follow', feed_queries[0])
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=0)
+    def test_celebrity_posts_are_merged_on_read(self):
+        """Посты «звёзд» не раскладываются, но видны в ленте."""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Test_text_new', author=self.author)
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=post).exists()
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [post, self.old_post]
+        )
+
+    def assert_post_does_not_touch_follower_feeds(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        self.authorized_client.get(reverse('posts:follow_index'))
+        version = get_feed_version(follow_scope(self.user.id))
+        post = Post.objects.create(text='Test_text_new', author=self.author)
+        self.assertEqual(get_feed_version(follow_scope(self.user.id)), version)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [post, self.old_post]
+        )
+        self.assertContains(response, 'Test_text_new')
+
+    def test_posts_do_not_touch_follower_feeds(self):
+        """Пост не сдвигает ленты подписчиков по одной,
+        но закэшированная лента подписок всё равно его показывает.
+        """
+        self.assert_post_does_not_touch_follower_feeds()
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=0)
+    def test_celebrity_posts_do_not_touch_follower_feeds(self):
+        """То же для постов «звёзд», которые подмешиваются при чтении."""
+        self.assert_post_does_not_touch_follower_feeds()
+
+
+@override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+class TimelineThresholdTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='Test_author')
+        self.user = User.objects.create(username='Test_name')
+        self.other = User.objects.create(username='Test_other')
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.other, author=self.author)
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_former_celebrity_posts_are_backfilled(self):
+        """Когда «звезда» опускается до порога, её посты раскладываются
+        по лентам подписчиков в фоне, и закэшированные ленты
+        пересобираются.
+        """
+        post = Post.objects.create(text='Test_text', author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.authorized_client.get(reverse('posts:follow_index'))
+        other_client = Client()
+        other_client.force_login(self.other)
+        other_client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username])
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists()
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.other).exists()
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import Signal
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .tasks import run_in_background
+
+# Миниатюры картинки созданы: закэшированные ленты и страницы с её
+# заглушкой нужно пересобрать (см. signals.thumbnails_created).
+thumbnails_ready = Signal(providing_args=['image_name'])
+
+
+def _thumbnail_name(source, alias):
+    """Имя файла миниатюры так же, как его вычисляет бэкенд sorl."""
+    backend = default.backend
+    geometry, options = settings.POST_THUMBNAILS[alias]
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return backend._get_thumbnail_filename(source, geometry, options)
+
+
+def _thumbnail_file(image, alias):
+    source = ImageFile(image)
+    return source, ImageFile(_thumbnail_name(source, alias), default.storage)
+
+
+def lookup_thumbnail(image, alias):
+    """Готовая миниатюра картинки или None.
+
+    Только чтение из хранилища ключей sorl: картинка не открывается
+    и не обрабатывается. Если миниатюры ещё нет, её генерация
+    ставится в фоновую очередь.
+    """
+    if not image:
+        return None
+    source, thumbnail = _thumbnail_file(image, alias)
+    cached = default.kvstore.get(thumbnail)
+    if cached is None:
+        schedule_thumbnails(source.name)
+    return cached
+
+
+def lookup_thumbnails(images, alias):
+    """Готовые миниатюры набора картинок одним запросом к хранилищу.
+
+    Принимает файлы или имена картинок, возвращает словарь
+    {имя картинки: миниатюра или None}.
+    """
+    files = dict(
+        _thumbnail_file(image, alias) for image in images if image
+    )
+    found = default.kvstore.get_many(files.values())
+    thumbnails = {}
+    for source, thumbnail in files.items():
+        cached = found[thumbnail.key]
+        if cached is None:
+            schedule_thumbnails(source.name)
+        thumbnails[source.name] = cached
+    return thumbnails
+
+
+def prefetch_thumbnails(posts, alias):
+    """Находит миниатюры всех постов страницы одним запросом к хранилищу.
+
+    Результат запоминается в post.thumbnails[alias], откуда его берёт
+    шаблонный тег post_thumbnail.
+    """
+    posts = [post for post in posts if post.image]
+    found = lookup_thumbnails([post.image for post in posts], alias)
+    for post in posts:
+        post.thumbnails = {
+            **getattr(post, 'thumbnails', {}), alias: found[post.image.name]
+        }
+
+
+def post_thumbnail(post, alias):
+    """Миниатюра поста: заранее найденная или найденная сейчас."""
+    thumbnails = getattr(post, 'thumbnails', {})
+    if alias in thumbnails:
+        return thumbnails[alias]
+    return lookup_thumbnail(post.image, alias)
+
+
+def generate_thumbnails(image_name):
+    """Создаёт все миниатюры из POST_THUMBNAILS для картинки."""
+    for geometry, options in settings.POST_THUMBNAILS.values():
+        get_thumbnail(image_name, geometry, **options)
+    thumbnails_ready.send(sender=None, image_name=image_name)
+
+
+def schedule_thumbnails(image_name):
+    """Ставит генерацию миниатюр в фон, не чаще раза в несколько минут."""
+    if cache.add(f'posts:thumbnails_pending:{image_name}', True, 60 * 5):
+        run_in_background(generate_thumbnails, image_name)
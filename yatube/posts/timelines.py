@@ -0,0 +1,129 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+
+def is_celebrity(followers_count):
+    """Посты авторов с большим числом подписчиков не раскладываются
+    по лентам, а подмешиваются при чтении.
+    """
+    return followers_count > settings.TIMELINE_FANOUT_THRESHOLD
+
+
+def followers_count(author_id):
+    return UserStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True
+    ).first() or 0
+
+
+def _bulk_insert(entries):
+    entries = iter(entries)
+    batch_size = settings.TIMELINE_FANOUT_BATCH_SIZE
+    batch = list(islice(entries, batch_size))
+    while batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        batch = list(islice(entries, batch_size))
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора пачками."""
+    if is_celebrity(followers_count(post.author_id)):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True).iterator()
+    _bulk_insert(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.pk,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика последние посты автора."""
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'pub_date')[:settings.TIMELINE_BACKFILL_LIMIT]
+    _bulk_insert(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+def trim(user_id, author_id):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def backfill_followers(author_id):
+    """Автор перестал быть «звездой»: его посты, которые не
+    раскладывались, добавляем в ленты всех подписчиков.
+
+    Возвращает id подписчиков, чьи ленты изменились. Если автор
+    успел снова стать «звездой», его посты по-прежнему подмешиваются
+    при чтении и раскладывать их не нужно.
+    """
+    if is_celebrity(followers_count(author_id)):
+        return []
+    followers = list(
+        Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True)
+    )
+    for user_id in followers:
+        backfill(user_id, author_id)
+    return followers
+
+
+def followed_authors(user):
+    """Авторы, на которых подписан пользователь, и «звёзды» среди них."""
+    authors, celebrities = [], []
+    follows = Follow.objects.filter(user=user).values_list(
+        'author_id', 'author__stats__followers_count'
+    )
+    for author_id, count in follows:
+        authors.append(author_id)
+        if is_celebrity(count or 0):
+            celebrities.append(author_id)
+    return authors, celebrities
+
+
+def celebrities_followed_by(user):
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gt=(
+                settings.TIMELINE_FANOUT_THRESHOLD
+            ),
+        ).values_list('author_id', flat=True)
+    )
+
+
+def follow_feed(user, celebrities=None):
+    """Посты ленты подписок пользователя.
+
+    Обычно это один проход по индексу ленты пользователя; если он
+    подписан на «звёзд», их посты подмешиваются из таблицы постов.
+    celebrities — уже найденный celebrities_followed_by(user).
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    if celebrities is None:
+        celebrities = celebrities_followed_by(user)
+    if celebrities:
+        return Post.objects.for_feed().filter(
+            Q(id__in=entries.values('post_id'))
+            | Q(author_id__in=celebrities)
+        )
+    return entries.order_by('-pub_date', '-post_id').posts()
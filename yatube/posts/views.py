@@ -1,65 +1,178 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+from PIL import Image
 from .forms import PostForm, CommentForm
-from .models import Post, Group, Follow
-from django.core.paginator import Paginator
+from . import images
+from .search import search_posts
+from .caching import (
+    author_scope, comments_cache_key, feed_cache_key, follow_feed_scope,
+    follow_scope,
+    group_scope, index_scope, post_scope, profile_scope, tag_scope,
+)
+from .pagecache import cached_page
+from .recompute import get_or_compute
+from .models import Comment, Post, Group, Follow, Tag
+from .paginators import CommentPaginator, CursorPaginator
+from .timelines import follow_feed, followed_authors
 
 
 User = get_user_model()
 NUM = 10
+COMMENTS_NUM = 20
+TOP_TAGS = 10
 
 
-def paginator(request, value):
-    paginator = Paginator(value, NUM)
+def paginator(request, value, scope=None):
+    paginator = CursorPaginator(value, NUM, scope=scope)
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    last = bool(request.GET.get('last'))
+    if after or before or last:
+        return paginator.cursor_page(after=after, before=before, last=last)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
 
 
+# Ленты, из которых собрана страница: по их поколениям считается
+# ETag и проверяется свежесть закэшированной страницы (см. pagecache).
+def index_scopes(request):
+    return [index_scope()]
+
+
+def group_scopes(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'id', flat=True
+    ).first()
+    if group_id is None:
+        return None
+    return [group_scope(group_id)]
+
+
+def tag_scopes(request, name):
+    tag_id = Tag.objects.filter(name=name.lower()).values_list(
+        'id', flat=True
+    ).first()
+    if tag_id is None:
+        return None
+    return [tag_scope(tag_id)]
+
+
+def profile_scopes(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'id', flat=True
+    ).first()
+    if author_id is None:
+        return None
+    scopes = [author_scope(author_id), profile_scope(author_id)]
+    if request.user.is_authenticated:
+        # Кнопка подписки зависит от подписок зрителя.
+        scopes.append(follow_scope(request.user.id))
+    return scopes
+
+
+def post_page_scopes(request, post_id):
+    post = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id'
+    ).first()
+    if post is None:
+        return None
+    author_id, group_id = post
+    # Счётчики автора в карточке меняются с его постами и подписчиками.
+    scopes = [
+        post_scope(post_id), author_scope(author_id),
+        profile_scope(author_id),
+    ]
+    if group_id is not None:
+        scopes.append(group_scope(group_id))
+    return scopes
+
+
+@cached_page(index_scopes)
 def index(request):
-    post_list = Post.objects.all()
-    page_obj = paginator(request, post_list)
+    scope = index_scope()
+    post_list = Post.objects.for_feed()
+    page_obj = paginator(request, post_list, scope)
     template = 'posts/index.html'
     context = {
         'page_obj': page_obj,
+        'feed_key': feed_cache_key(scope, request),
+        'feed_timeout': settings.FEED_CACHE_TIMEOUT,
+        'top_tags': Tag.objects.top(TOP_TAGS),
         'index': True
     }
     return render(request, template, context)
 
 
+@cached_page(group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group)
-    page_obj = paginator(request, posts)
+    scope = group_scope(group.id)
+    posts = Post.objects.for_feed().filter(group=group)
+    page_obj = paginator(request, posts, scope)
     template = 'posts/group_list.html'
     context = {
         'page_obj': page_obj,
+        'feed_key': feed_cache_key(scope, request),
+        'feed_timeout': settings.FEED_CACHE_TIMEOUT,
         'group': group,
     }
     return render(request, template, context)
 
 
+@cached_page(tag_scopes)
+def tag_posts(request, name):
+    tag = get_object_or_404(Tag, name=name.lower())
+    scope = tag_scope(tag.id)
+    posts = tag.post_links.order_by('-pub_date', '-post_id').posts()
+    page_obj = paginator(request, posts, scope)
+    context = {
+        'page_obj': page_obj,
+        'feed_key': feed_cache_key(scope, request),
+        'feed_timeout': settings.FEED_CACHE_TIMEOUT,
+        'tag': tag,
+    }
+    return render(request, 'posts/tag_list.html', context)
+
+
+@cached_page(profile_scopes)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
     following = (
         request.user.is_authenticated and Follow.objects.filter(
             user=request.user, author=author
         ).exists()
     )
-    posts = author.posts.all()
-    page_obj = paginator(request, posts)
+    scope = author_scope(author.id)
+    posts = author.posts.for_feed()
+    page_obj = paginator(request, posts, scope)
     context = {
         'following': following,
         'author': author,
         'page_obj': page_obj,
+        'feed_key': feed_cache_key(scope, request),
+        'feed_timeout': settings.FEED_CACHE_TIMEOUT,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@cached_page(post_page_scopes)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
+    )
     form = CommentForm(request.POST or None)
+    # Комментарии подгружаются отдельно через post_comments,
+    # поэтому страница поста от них не зависит.
     context = {
         'post': post,
         'post_id': post_id,
@@ -68,6 +181,72 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def comments_etag(request, post_id):
+    return comments_cache_key(post_id, request)
+
+
+@condition(etag_func=comments_etag)
+def post_comments(request, post_id):
+    """Страница комментариев поста: JSON или HTML-фрагмент (?format=html).
+
+    after — следующая страница после курсора; since — комментарии,
+    появившиеся после последнего показанного, для опроса. В ответе
+    cursor — курсор последнего комментария для следующего запроса.
+    Ответ не зависит от пользователя и кэшируется до следующего
+    комментария, поэтому опрос без новых комментариев получает 304
+    или готовый ответ без запросов к базе.
+    """
+    content, content_type = get_or_compute(
+        comments_cache_key(post_id, request),
+        lambda: render_comments(request, post_id),
+        settings.FEED_CACHE_TIMEOUT,
+    )
+    return HttpResponse(content, content_type=content_type)
+
+
+def render_comments(request, post_id):
+    count = Post.objects.filter(pk=post_id).values_list(
+        'comment_count', flat=True
+    ).first()
+    if count is None:
+        raise Http404
+    cursor = request.GET.get('since') or request.GET.get('after')
+    paginator = CommentPaginator(
+        Comment.objects.filter(post_id=post_id).for_page(), COMMENTS_NUM
+    )
+    page = paginator.cursor_page(after=cursor)
+    if len(page):
+        cursor = paginator.cursor_of(page[-1])
+    context = {
+        'comments': page,
+        'count': count,
+        'cursor': cursor or '',
+    }
+    if request.GET.get('format') == 'html':
+        response = render(
+            request, 'posts/includes/comments_page.html', context
+        )
+    else:
+        response = JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'author_url': reverse(
+                        'posts:profile', args=[comment.author.username]
+                    ),
+                    'text': comment.text,
+                    'created': comment.created.isoformat(),
+                }
+                for comment in page
+            ],
+            'count': count,
+            'cursor': cursor or '',
+            'has_more': page.has_next(),
+        })
+    return response.content, response['Content-Type']
+
+
 @login_required
 def add_comment(request, post_id):
     """Save comment in DB."""
@@ -129,18 +308,35 @@ def post_edit(request, post_id):
     return render(request, 'posts/create_post.html', context)
 
 
+def search(request):
+    """Поиск постов по тексту, самые подходящие первыми."""
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        page_obj = Paginator(search_posts(query), NUM).get_page(
+            request.GET.get('page')
+        )
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginator(request, posts)
+    authors, celebrities = followed_authors(request.user)
+    scope = follow_feed_scope(request.user.id, authors)
+    posts = follow_feed(request.user, celebrities)
+    page_obj = paginator(request, posts, scope)
     # Добавил проверку на то подписан ли юзер хотя бы на одного пользователя
     # что бы в случае False, отобразить пользователю сообщение об этом,
     # и предложить перейти на главную
-    existence_of_subscription = Follow.objects.filter(
-        user=request.user
-    ).exists()
+    existence_of_subscription = bool(authors)
     context = {
         'page_obj': page_obj,
+        'feed_key': feed_cache_key(scope, request),
+        'feed_timeout': settings.FEED_CACHE_TIMEOUT,
         'follow': True,
         'existence_of_subscription': existence_of_subscription
     }
@@ -151,16 +347,11 @@ def follow_index(request):
 def profile_follow(request, username):
     """Подписаться на автора"""
     author = get_object_or_404(User, username=username)
-    check_for_existence = (
-        Follow.objects.filter(
-            user=request.user, author=author
-        ).exists()
-    )
-    if not check_for_existence and author != request.user:
-        Follow.objects.create(
-            user=request.user,
-            author=author
-        )
+    # Уникальный индекс (user, author) сам отсекает повторную подписку,
+    # поэтому предварительная проверка exists() не нужна и не создаёт
+    # гонку при одновременных кликах.
+    if author != request.user:
+        Follow.objects.follow(request.user, author)
     return redirect('posts:profile', username)
 
 
@@ -179,3 +370,30 @@ def profile_unfollow(request, username):
         author=author
     ).delete()
     return redirect('posts:profile', username)
+
+
+def image_variant(request, signature, alias, width, name):
+    """Картинка поста нужного размера; WebP, если клиент его принимает.
+
+    Параметры подписаны, поэтому отдаются только размеры из
+    POST_IMAGE_VARIANTS для реальных картинок. В имени картинки есть
+    метка её содержимого (images.content_name), поэтому ответ можно
+    кэшировать навсегда: другая картинка получит другой адрес.
+    """
+    if (
+        images.variant_size(alias, width) is None
+        or not images.check_variant_signature(signature, name, alias, width)
+    ):
+        raise Http404
+    try:
+        path, image_format = images.get_variant(
+            name, alias, width, request.META.get('HTTP_ACCEPT', '')
+        )
+    except (OSError, Image.DecompressionBombError):
+        raise Http404
+    response = FileResponse(
+        open(path, 'rb'), content_type=Image.MIME[image_format]
+    )
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    patch_vary_headers(response, ['Accept'])
+    return response
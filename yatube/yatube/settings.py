@@ -66,6 +66,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'posts.pagecache.AnonymousPageCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -151,8 +152,99 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
+# Кэш общий для всех процессов хоста: записи лежат в файле SQLite
+# (WAL) рядом с базой, поэтому прогрев, счётчики и поколения
+# лент одни на все воркеры. Файл можно удалить в любой момент.
+# Перед ним у каждого процесса небольшой LRU-кэш (MAX_ENTRIES записей
+# не дольше L1_TIMEOUT секунд); записи, изменённые другими процессами,
+# выбрасываются из него не позже чем через BROADCAST_INTERVAL секунд
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 5,
+            'BROADCAST_INTERVAL': 0.2,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    },
+}
+
+# Тесты очищают кэш, поэтому запускаются с общим L2 в памяти
+# процесса (core.test_runner), а не с файлом выше
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+# Сколько хранить в кэше количество постов в лентах; счётчики
+# поддерживаются сигналами, TTL лишь ограничивает возможный дрейф
+FEED_COUNT_CACHE_TIMEOUT = 60 * 60
+
+# Время жизни закэшированных фрагментов лент. Ключи фрагментов
+# содержат поколение ленты, которое сигналы Post/Comment/Follow
+# сдвигают при каждом изменении, поэтому TTL может быть долгим
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Лента подписок материализуется: новый пост раскладывается по лентам
+# подписчиков пачками по TIMELINE_FANOUT_BATCH_SIZE записей. Посты
+# авторов, у которых подписчиков больше TIMELINE_FANOUT_THRESHOLD,
+# не раскладываются, а подмешиваются при чтении. При подписке в ленту
+# добавляются последние TIMELINE_BACKFILL_LIMIT постов автора
+TIMELINE_FANOUT_THRESHOLD = 1000
+TIMELINE_FANOUT_BATCH_SIZE = 500
+TIMELINE_BACKFILL_LIMIT = 1000
+
+# Фоновые задачи (миниатюры и т.п.) выполняются в пуле потоков
+# после коммита транзакции; EAGER выполняет их сразу, без пула
+BACKGROUND_WORKERS = 2
+BACKGROUND_TASKS_EAGER = False
+
+# Миниатюры картинок постов: имя -> (геометрия, опции sorl).
+# Создаются в фоне при сохранении картинки, шаблоны их только читают
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+
+# Метаданные миниатюр sorl хранятся в кэше с таблицей sorl за ним;
+# ленты находят миниатюры всей страницы одним get_many
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+
+# Загрузки пишутся на диск кусками, а не собираются в памяти
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Ограничения картинок постов: размер файла, число пикселей
+# по заголовку и большая сторона, до которой картинка уменьшается
+POST_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+POST_IMAGE_MAX_SIDE = 1920
+
+# Варианты картинок постов для srcset: имя -> (базовый размер,
+# разрешённые ширины). Создаются по запросу и хранятся на диске
+# в MEDIA_ROOT/POST_IMAGE_VARIANTS_DIR
+POST_IMAGE_VARIANTS = {
+    'card': ((960, 339), (480, 960, 1440)),
 }
+POST_IMAGE_VARIANTS_DIR = 'variants'
+
+# Страницы лент и постов кэшируются целиком для анонимов. Копия
+# свежа PAGE_CACHE_TIMEOUT, затем ещё PAGE_CACHE_STALE_TIMEOUT
+# отдаётся, пока новая собирается в фоне; после изменения лент
+# страницу пересобирает первый запрос
+PAGE_CACHE_TIMEOUT = 60
+PAGE_CACHE_STALE_TIMEOUT = 60 * 10
+
+# Пересчёт значений кэша (фрагменты лент, страницы) ведёт один
+# владелец блокировки; она живёт не дольше RECOMPUTE_LOCK_TIMEOUT,
+# остальные проверяют кэш каждые RECOMPUTE_WAIT_INTERVAL секунд.
+# RECOMPUTE_BETA — насколько заранее (в длительностях расчёта)
+# значение пересчитывается до истечения
+RECOMPUTE_LOCK_TIMEOUT = 10
+RECOMPUTE_WAIT_INTERVAL = 0.05
+RECOMPUTE_BETA = 1.0